@@ -0,0 +1,63 @@
+'''Import-time benchmark for stock_info and stock_news.
+
+   Every module is imported in a fresh interpreter with -X importtime, several
+   times, and the median cumulative import time is compared to a budget. The run
+   also fails if importing pulled in one of the heavy dependencies that are
+   supposed to be deferred to first use.
+
+   python benchmarks/bench_import_time.py [--repeat 7] [--budget-ms 150]
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["stock_info", "stock_news"]
+HEAVY_MODULES = ["pandas", "numpy", "yfinance", "click", "requests", "requests_html",
+                 "nltk", "feedparser", "ftplib"]
+
+
+def import_time_us(module):
+    '''Cumulative import time of module in microseconds, from a fresh interpreter'''
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def loaded_heavy_modules(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        times_ms = [import_time_us(module) / 1000 for _ in range(args.repeat)]
+        median_ms = statistics.median(times_ms)
+        heavy = loaded_heavy_modules(module)
+
+        print(f"{module}: median {median_ms:.1f} ms, min {min(times_ms):.1f} ms, max {max(times_ms):.1f} ms")
+        if median_ms > args.budget_ms:
+            print(f"    FAILED: over the {args.budget_ms} ms budget")
+            failed = True
+        if heavy:
+            print(f"    FAILED: eagerly imports {', '.join(heavy)}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+'''Offline benchmarks of the scan, against recorded Yahoo/MarketWatch payloads
+   served by the local stand-in server (stub_server.py).
+
+   Measures _parse_json (request + parse, and the parse alone),
+   collect_statements, get_data frame building, get_marketwatch_data, headline
+   scoring and end-to-end tickers per second at several concurrency levels.
+   Results are saved as JSON under benchmarks/results/ and can be compared with
+   an earlier run. Without recorded fixtures, generated payloads of the same
+   shape are served.
+
+   python benchmarks/bench_scan.py [--fixtures DIR] [--repeat 5] [--tickers 40]
+                                   [--concurrency 1 4 16] [--compare RESULTS.json]
+   python benchmarks/bench_scan.py --record AAPL --fixtures DIR
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+sys.path.insert(0, REPO_DIR)
+
+import stub_server
+from quote_summary import parse_quote_summary
+
+
+def measure(function, repeat):
+    '''Runs function repeat times; median and min seconds per run'''
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return {"median_s": statistics.median(times), "min_s": min(times), "runs": repeat}
+
+
+def new_stock_info(url, work_dir):
+    '''StockInfo pointed at the stand-in server, with its caches and warehouse in
+       work_dir so that the user's are left alone'''
+    from stock_info import StockInfo
+    from warehouse import Warehouse
+
+    stock_info = StockInfo(risk_free_rate=1.5, cache_dir=work_dir)
+    stock_info.point_at(url)
+    stock_info._warehouse = Warehouse(os.path.join(work_dir, "fundamentals.sqlite"))
+    stock_info.output_directory = work_dir
+    stock_info.prescreen = None
+    stock_info.use_refresh_scheduler = False
+    return stock_info
+
+
+def bench_parse_json(url, work_dir, fixtures, repeat):
+    stock_info = new_stock_info(url, work_dir)
+    return measure(lambda: stock_info._parse_json(stock_info._fundamentals_url("AAA", "cash-flow")), repeat)
+
+
+def bench_parse_quote_summary(url, work_dir, fixtures, repeat):
+    page = fixtures["quote_page"]
+    return measure(lambda: parse_quote_summary(page), repeat)
+
+
+def bench_collect_statements(url, work_dir, fixtures, repeat):
+    import pandas as pd
+
+    stock_info = new_stock_info(url, work_dir)
+    json_info = parse_quote_summary(fixtures["quote_page"])
+    cash_flow = pd.DataFrame(json_info["cashflowStatementHistory"]["cashflowStatements"]).drop(columns="maxAge")
+    income = pd.DataFrame(json_info["incomeStatementHistory"]["incomeStatementHistory"]).drop(columns="maxAge")
+    # the estimates come from the (cached) analysis page
+    stock_info.fundamentals.set("analysis_AAA", {"earningsTrend": json_info["earningsTrend"]})
+    stock_info.refresh_tickers = set()
+    return measure(lambda: stock_info.collect_statements("AAA", cash_flow.copy(), income.copy()), repeat)
+
+
+def bench_get_data(url, work_dir, fixtures, repeat):
+    stock_info = new_stock_info(url, work_dir)
+    return measure(lambda: stock_info.get_data("AAA"), repeat)
+
+
+def bench_get_marketwatch_data(url, work_dir, fixtures, repeat):
+    stock_info = new_stock_info(url, work_dir)
+    return measure(lambda: stock_info.get_marketwatch_data("AAA"), repeat)
+
+
+def bench_score_news(url, work_dir, fixtures, repeat):
+    import feedparser
+    from news_scoring import NewsScorer
+    from stock_news import parse_yf_news, score_yf_news
+
+    entries = feedparser.parse(fixtures["rss"]).entries
+    rows = parse_yf_news(entries, "AAA")*20
+    scorer = NewsScorer()
+    result = measure(lambda: score_yf_news(rows, scorer), repeat)
+    result["headlines"] = len(rows)
+    return result
+
+
+def bench_end_to_end(url, work_dir, fixtures, repeat, tickers, concurrency):
+    from scan_pipeline import ScanPipeline
+
+    results = {}
+    for workers in concurrency:
+        def scan():
+            stock_info = new_stock_info(url, tempfile.mkdtemp(dir=work_dir))
+            stock_info.scan_pipeline = ScanPipeline(stock_info, fetch_workers=workers, requests_per_second=0)
+            stock_info.scan_tickers([f"T{i:04d}" for i in range(tickers)])
+            stock_info.fill_required_growth()
+        result = measure(scan, max(1, repeat // 2))
+        result["tickers_per_s"] = tickers/result["median_s"]
+        results[f"fetch_workers_{workers}"] = result
+    return results
+
+
+BENCHMARKS = [("parse_json", bench_parse_json),
+              ("parse_quote_summary", bench_parse_quote_summary),
+              ("collect_statements", bench_collect_statements),
+              ("get_data", bench_get_data),
+              ("get_marketwatch_data", bench_get_marketwatch_data),
+              ("score_news", bench_score_news)]
+
+
+def record(ticker, directory):
+    '''Downloads the live payloads of ticker into directory as fixtures'''
+    from stock_info import StockInfo
+
+    stock_info = StockInfo()
+    os.makedirs(directory, exist_ok=True)
+    urls = {"quote_page": stock_info._fundamentals_url(ticker, "cash-flow"),
+            "chart": stock_info.base_url + ticker,
+            "quote": stock_info.query_url + "/v7/finance/quote?symbols=" + ticker,
+            "marketwatch_financials": f"{stock_info.marketwatch_url}/investing/stock/{ticker}/financials",
+            "bonds": stock_info.yahoo_url + "/bonds",
+            "earnings_calendar": stock_info.yahoo_url + "/calendar/earnings",
+            "rss": "https://feeds.finance.yahoo.com/rss/2.0/headline?s=%s&region=US&lang=en-US" % ticker}
+    for name, url in urls.items():
+        text = stock_info._http_get(url, headers={'User-Agent': 'Custom'}).text
+        if name == "quote":
+            # the server answers with this entry for every requested symbol
+            text = json.dumps(json.loads(text)["quoteResponse"]["result"][0])
+        with open(os.path.join(directory, stub_server.FIXTURE_FILES[name]), "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"recorded {name} from {url}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)["results"]
+    print(f"compared with {previous_path} (ratio < 1 is faster now):")
+    for name, result in results.items():
+        entries = result.items() if name == "end_to_end" else [(name, result)]
+        for label, entry in entries:
+            before = previous.get(name, {})
+            before = before.get(label, {}) if name == "end_to_end" else before
+            if "median_s" in entry and before.get("median_s"):
+                print(f"  {label}: {entry['median_s']/before['median_s']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="directory of recorded payloads")
+    parser.add_argument("--record", metavar="TICKER", help="record the payloads of TICKER into --fixtures and exit")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tickers", type=int, default=40, help="tickers of the end-to-end scan")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.fixtures:
+            raise AssertionError("--record needs --fixtures")
+        record(args.record, args.fixtures)
+        return 0
+
+    fixtures = stub_server.load_fixtures(args.fixtures)
+    results = {}
+    with stub_server.StubServer(fixtures) as server, tempfile.TemporaryDirectory() as work_dir:
+        for name, benchmark in BENCHMARKS:
+            try:
+                results[name] = benchmark(server.url, work_dir, fixtures, args.repeat)
+                print(f"{name}: median {results[name]['median_s']*1000:.2f} ms")
+            except (ImportError, LookupError) as e:
+                # LookupError: nltk data such as the VADER lexicon is missing
+                print(f"{name}: skipped, {e!r}")
+        try:
+            results["end_to_end"] = bench_end_to_end(server.url, work_dir, fixtures, args.repeat,
+                                                     args.tickers, args.concurrency)
+            for label, result in results["end_to_end"].items():
+                print(f"end_to_end {label}: {result['tickers_per_s']:.1f} tickers/s")
+        except (ImportError, LookupError) as e:
+            print(f"end_to_end: skipped, {e!r}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    fname = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    with open(fname, "w") as f:
+        json.dump({"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                   "fixtures": args.fixtures or "generated", "config": vars(args), "results": results}, f, indent=1)
+    print(f"results saved into {fname}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
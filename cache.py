@@ -0,0 +1,82 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".dcf_data_extractor", "cache")
+
+
+def write_atomic(path, text):
+    '''Writes text into path through a temporary file in the same directory and
+       os.replace, so a reader sees either the old or the new content, never a
+       half-written file'''
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FileCache:
+    '''Small JSON key/value cache kept on disk, one file per key, so that it is
+       shared between StockInfo instances, threads and processes.
+
+       Entries older than ttl seconds are treated as missing; ttl=None keeps them
+       forever. Writes go through a temporary file and os.replace, so a reader
+       never sees a half-written entry.
+    '''
+
+    def __init__(self, name, ttl = None, cache_dir = None):
+        self.directory = os.path.join(cache_dir or DEFAULT_CACHE_DIR, name)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', key) + ".json")
+
+    def get(self, key, ttl = None):
+        '''Returns the cached value, or None if it is missing or expired
+
+           @param: key
+           @param: ttl = None - overrides the cache's ttl for this lookup
+        '''
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is None or (ttl is not None and time.time() - entry["stored_at"] > ttl):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["value"]
+
+    def stored_at(self, key):
+        '''Returns the time.time() the key was last written, or None'''
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)["stored_at"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        write_atomic(self._path(key), json.dumps({"stored_at": time.time(), "value": value}))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
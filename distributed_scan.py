@@ -0,0 +1,245 @@
+'''Sharded get_cash_flow_for_all: the ticker list is split into shards kept in a
+   SQLite work queue, any number of worker processes (on this or other machines
+   sharing the queue file) lease shards and write one result file per shard,
+   and merge combines the shard results into the usual output tables.
+
+   python distributed_scan.py create --queue scan.sqlite [--tickers-file FILE] [--shard-size 50] [--prescreen]
+   python distributed_scan.py worker --queue scan.sqlite --results DIR [--processes 4]
+                                     [--profile-sample 20|AAPL,MSFT] [--profile-dir DIR]
+   python distributed_scan.py status --queue scan.sqlite
+   python distributed_scan.py merge --queue scan.sqlite --results DIR --output DIR [--format csv]
+'''
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+from cache import write_atomic
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    shard_id INTEGER PRIMARY KEY,
+    tickers TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class WorkQueue:
+    '''Shards of a ticker list in a SQLite file. A worker claims a pending shard,
+       or one whose lease expired (its worker died), inside an immediate
+       transaction, so two workers never hold the same shard; done shards stay
+       done. The file has to be on storage with working file locks for workers
+       on several machines.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.executescript(_SCHEMA)
+
+    def create(self, tickers, shard_size = 50):
+        '''Replaces the queue's shards by consecutive shard_size slices of tickers'''
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.execute("DELETE FROM shards")
+        self.connection.executemany("INSERT INTO shards (shard_id, tickers) VALUES (?, ?)",
+                                    [(index, json.dumps(tickers[start:start + shard_size]))
+                                     for index, start in enumerate(range(0, len(tickers), shard_size))])
+        self.connection.execute("COMMIT")
+
+    def claim(self, worker, lease_seconds):
+        '''Leases the next available shard to worker; returns (shard_id, tickers),
+           or None when every shard is done or leased'''
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute("""SELECT shard_id, tickers FROM shards
+                                             WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?)
+                                             ORDER BY shard_id LIMIT 1""", (now,)).fetchone()
+            if row is not None:
+                self.connection.execute("""UPDATE shards SET state = 'leased', worker = ?, lease_until = ?,
+                                           attempts = attempts + 1 WHERE shard_id = ?""",
+                                        (worker, now + lease_seconds, row[0]))
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def complete(self, shard_id, worker):
+        '''Marks a shard done; False if the lease was lost to another worker meanwhile'''
+        cursor = self.connection.execute("""UPDATE shards SET state = 'done', lease_until = NULL
+                                            WHERE shard_id = ? AND worker = ? AND state = 'leased'""",
+                                         (shard_id, worker))
+        return cursor.rowcount == 1
+
+    def status(self):
+        '''{state: shard count}; leases past their time are counted as "expired"'''
+        rows = self.connection.execute("""SELECT CASE WHEN state = 'leased' AND lease_until < ? THEN 'expired'
+                                          ELSE state END, count(*) FROM shards GROUP BY 1""", (time.time(),))
+        return dict(rows.fetchall())
+
+    def shard_ids(self):
+        return [row[0] for row in self.connection.execute("SELECT shard_id FROM shards ORDER BY shard_id")]
+
+
+def shard_result_path(results_dir, shard_id):
+    return os.path.join(results_dir, f"shard_{shard_id:05d}.json")
+
+
+def scan_shard(tickers, results_dir, shard_id, profile_sample = None, profile_directory = None):
+    '''Scans one shard with a fresh StockInfo and writes its tables and WACC
+       fallbacks into the shard's result file
+
+       @param: profile_sample = None - profiles a sample of the shard instead (see
+                                       StockInfo.profile_sample), its result then
+                                       has only the sampled tickers
+       @param: profile_directory = None - of the reports, results_dir if None
+    '''
+    from profiling import sample_tickers
+    from stock_info import StockInfo
+
+    stock_info = StockInfo()
+    stock_info.output_directory = results_dir
+    stock_info.prescreen = None
+    run_string = f"shard_{shard_id:05d}"
+    if profile_sample is not None:
+        # a profiled scan computes the WACC in collect_statements
+        stock_info.profile_scan(sample_tickers(tickers, profile_sample),
+                                os.path.join(profile_directory or results_dir, run_string + "_profile"))
+    else:
+        stock_info.scan_tickers(tickers, run_string)
+        if stock_info.batch_wacc:
+            stock_info.fill_required_growth()
+
+    result = {name: {"columns": list(columns), "rows": rows}
+              for name, rows, columns in stock_info.collected_tables()}
+    if stock_info.wacc_fallbacks is not None:
+        result["wacc_fallbacks"] = {"columns": ["Ticker", "reason"],
+                                    "rows": [[ticker, reason] for ticker, reason in stock_info.wacc_fallbacks["reason"].items()]}
+    write_atomic(shard_result_path(results_dir, shard_id), json.dumps(result))
+
+
+def run_worker(queue_path, results_dir, lease_seconds = 1800, profile_sample = None, profile_directory = None):
+    '''Takes shards from the queue until none is left; profile_sample and
+       profile_directory as in scan_shard'''
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    work_queue = WorkQueue(queue_path)
+    os.makedirs(results_dir, exist_ok=True)
+    while True:
+        shard = work_queue.claim(worker, lease_seconds)
+        if shard is None:
+            print(f"worker {worker}: no shards left")
+            return
+        shard_id, tickers = shard
+        print(f"worker {worker}: shard {shard_id}, {len(tickers)} tickers")
+        scan_shard(tickers, results_dir, shard_id, profile_sample, profile_directory)
+        if not work_queue.complete(shard_id, worker):
+            print(f"worker {worker}: lease of shard {shard_id} expired, its result may be overwritten")
+
+
+def merge(queue_path, results_dir, output):
+    '''Concatenates the shard results in shard order and writes the cash_flow,
+       revenue, net_income, required_growth and wacc_fallbacks tables through
+       the OutputWriter; missing shards are reported and skipped
+
+       @param: output - output.OutputWriter
+    '''
+    from output import ticker_table_dtypes
+
+    frames = {}
+    missing = []
+    for shard_id in WorkQueue(queue_path).shard_ids():
+        try:
+            with open(shard_result_path(results_dir, shard_id)) as f:
+                result = json.load(f)
+        except OSError:
+            missing.append(shard_id)
+            continue
+        for name, table in result.items():
+            frames.setdefault(name, []).append(pd.DataFrame(table["rows"], columns=table["columns"]))
+    if missing:
+        print(f"merge: no results for shards {missing}")
+
+    for name, shard_frames in frames.items():
+        merged = pd.concat(shard_frames, ignore_index=True)
+        if name == "wacc_fallbacks":
+            output.write(merged.set_index("Ticker"), name, {"reason": "string"})
+            continue
+        # shards may have seen different years, keep them in order after the ticker
+        value_columns = sorted(column for column in merged.columns if column != "Ticker")
+        merged = merged[["Ticker"] + value_columns]
+        output.write(merged, name, ticker_table_dtypes(merged))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["create", "worker", "status", "merge"])
+    parser.add_argument("--queue", required=True, help="SQLite work queue file")
+    parser.add_argument("--tickers-file", help="create: one ticker per line, stocks.all_stocks if not given")
+    parser.add_argument("--shard-size", type=int, default=50)
+    parser.add_argument("--prescreen", action="store_true", help="create: drop tickers failing the quote pre-screen")
+    parser.add_argument("--results", help="directory of the per-shard result files")
+    parser.add_argument("--processes", type=int, default=1, help="worker: local worker processes to start")
+    parser.add_argument("--lease-seconds", type=int, default=1800)
+    parser.add_argument("--output", help="merge: output directory")
+    parser.add_argument("--format", default="csv", help="merge: csv, parquet or feather")
+    parser.add_argument("--profile-sample", default=os.environ.get("DCF_PROFILE_SAMPLE"),
+                        help="worker: profile this many tickers (or these comma separated tickers) of each shard "
+                             "instead of scanning it, $DCF_PROFILE_SAMPLE by default")
+    parser.add_argument("--profile-dir", default=os.environ.get("DCF_PROFILE_DIR"),
+                        help="worker: directory of the profile reports, --results if not given, $DCF_PROFILE_DIR by default")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        if args.tickers_file:
+            with open(args.tickers_file) as f:
+                tickers = [line.strip() for line in f if line.strip()]
+        else:
+            import stocks
+            tickers = list(stocks.all_stocks)
+        if args.prescreen:
+            from stock_info import StockInfo
+            tickers = StockInfo().prescreen.run(tickers)
+        work_queue = WorkQueue(args.queue)
+        work_queue.create(tickers, args.shard_size)
+        print(f"{len(tickers)} tickers in {len(work_queue.shard_ids())} shards")
+
+    elif args.command == "worker":
+        if not args.results:
+            raise AssertionError("worker needs --results")
+        if args.processes > 1:
+            command = [sys.executable, os.path.abspath(__file__), "worker", "--queue", args.queue,
+                       "--results", args.results, "--lease-seconds", str(args.lease_seconds)]
+            if args.profile_sample:
+                command += ["--profile-sample", args.profile_sample]
+            if args.profile_dir:
+                command += ["--profile-dir", args.profile_dir]
+            workers = [subprocess.Popen(command) for i in range(args.processes)]
+            sys.exit(max(worker.wait() for worker in workers))
+        from profiling import parse_sample
+        run_worker(args.queue, args.results, args.lease_seconds,
+                   parse_sample(args.profile_sample), args.profile_dir)
+
+    elif args.command == "status":
+        print(WorkQueue(args.queue).status())
+
+    else:
+        from output import OutputWriter
+        if not args.results or not args.output:
+            raise AssertionError("merge needs --results and --output")
+        merge(args.queue, args.results, OutputWriter(args.output, args.format))
+
+
+if __name__ == '__main__':
+    main()
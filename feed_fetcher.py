@@ -0,0 +1,79 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import FileCache
+from lazy_imports import lazy_import
+
+feedparser = lazy_import("feedparser")
+requests = lazy_import("requests")
+
+
+class FeedFetcher:
+    '''Downloads RSS feeds on a bounded thread pool with conditional GETs.
+
+       The ETag and Last-Modified validators of every feed are kept in a file
+       cache and sent back as If-None-Match / If-Modified-Since on the next run,
+       so feeds that did not change answer 304 and are reported with no entries.
+       The validators of a downloaded feed are only kept once the caller calls
+       remember(), after it stored the feed's headlines, so a run that fails
+       before that downloads the feed in full again next time. The fetch threads
+       only download; feedparser runs on the consuming thread.
+    '''
+
+    def __init__(self, max_workers = 16, timeout = 10, cache_dir = None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.validators = FileCache("feed_validators", cache_dir=cache_dir)
+        self.not_modified = 0
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    def _fetch(self, url):
+        headers = {'User-Agent': 'Custom'}
+        validators = self.validators.get(self._key(url)) or {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304:
+            return None, None
+        resp.raise_for_status()
+        return resp.content, {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+
+    def remember(self, url, validators):
+        '''Keeps the validators fetch() yielded for url for the next run'''
+        if validators and (validators["etag"] or validators["last_modified"]):
+            self.validators.set(self._key(url), validators)
+
+    def fetch(self, urls):
+        '''Yields (url, entries, validators) for every feed as soon as it is
+           downloaded; entries is empty and validators None for feeds that were
+           not modified since the previous run. Pass the validators to remember()
+           once the entries are stored. Feeds that fail are reported and skipped.
+
+           @param: urls - iterable of feed urls
+        '''
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    content, validators = future.result()
+                except Exception as e:
+                    print(f"FAILED to fetch {url}: {e}")
+                    continue
+
+                if content is None:
+                    self.not_modified += 1
+                    yield url, [], None
+                    continue
+
+                yield url, feedparser.parse(content).entries, validators
@@ -0,0 +1,28 @@
+import importlib
+import sys
+import threading
+import types
+
+_lock = threading.RLock()
+
+
+class _LazyModule(types.ModuleType):
+    '''Stand-in for a module that is imported on first attribute access'''
+
+    def __getattr__(self, attr):
+        with _lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    '''Returns the module if it is already imported, otherwise a proxy that imports
+       it the first time one of its attributes is used. Keeps heavy dependencies
+       (pandas, requests, nltk, ...) out of the import time of our modules.
+
+       @param: name - absolute module name, e.g. "pandas" or "nltk.sentiment.vader"
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
@@ -0,0 +1,102 @@
+import re
+from html.parser import HTMLParser
+
+
+class _TableFound(Exception):
+    pass
+
+
+class _IncomeStatementParser(HTMLParser):
+    '''Picks the latest-year value of selected rows out of the first table whose
+       header row starts with "Item" followed by year columns - the layout of the
+       income statement on MarketWatch's financials page. Every other table is
+       skipped cell by cell, nothing is turned into data frames.'''
+
+    def __init__(self, labels):
+        super().__init__(convert_charrefs=True)
+        self.labels = set(labels)
+        self.values = {}
+
+        self._table_depth = 0
+        self._row = None
+        self._cell = None
+        self._header_seen = False
+        self._is_income_table = False
+        self._year_column = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self._table_depth += 1
+            if self._table_depth == 1:
+                self._header_seen = False
+                self._is_income_table = False
+                self._year_column = None
+        elif self._table_depth != 1:
+            return
+        elif tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            self._table_depth -= 1
+            if self._table_depth == 0 and self._is_income_table:
+                raise _TableFound()
+        elif self._table_depth != 1:
+            return
+        elif tag in ("td", "th") and self._cell is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self._handle_row(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _handle_row(self, cells):
+        if not cells:
+            return
+
+        if not self._header_seen:
+            self._header_seen = True
+            years = [(int(cell), i) for i, cell in enumerate(cells) if re.fullmatch(r"\d{4}", cell)]
+            if cells[0].startswith("Item") and years:
+                self._is_income_table = True
+                self._year_column = max(years)[1]
+            return
+
+        if not self._is_income_table or self._year_column >= len(cells):
+            return
+
+        # row titles are rendered twice ("Pretax Income  Pretax Income")
+        words = cells[0].split()
+        half = len(words) // 2
+        if len(words) % 2 == 0 and words[:half] == words[half:]:
+            words = words[:half]
+        label = " ".join(words)
+        if label in self.labels:
+            self.values[label] = cells[self._year_column]
+
+
+def read_income_statement_rows(chunks, labels):
+    '''Streams HTML text chunks through the parser and stops as soon as the income
+       statement table has been read. Returns {label: latest year's raw text} for
+       the labels found; raises AssertionError when the page has no income
+       statement table.
+
+       @param: chunks - iterable of str, e.g. requests' iter_content(decode_unicode=True)
+       @param: labels - row titles to extract
+    '''
+    parser = _IncomeStatementParser(labels)
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+    except _TableFound:
+        pass
+    if not parser._is_income_table:
+        raise AssertionError("no income statement table found")
+    return parser.values
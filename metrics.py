@@ -0,0 +1,192 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from cache import write_atomic
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class Metrics:
+    '''Thread-safe counters of a run: time and calls per stage, requests, time,
+       bytes and errors per host, named counters (retries, throttled, ...), the
+       hit rates of registered FileCaches and the time spent per ticker: per
+       stage, and in total counting only the outermost ticker stage of a thread,
+       since stages nest (get_cash_flow_pg runs collect_statements, which runs
+       _parse_json).
+
+       snapshot() returns all of it as a dict; start_export() keeps a JSON and a
+       Prometheus text file of it up to date while a scan runs.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.hosts = {}
+        self.counters = {}
+        self.tickers = {}
+        self.ticker_seconds = {}
+        self.caches = {}
+        # per thread, how many timed ticker stages are running
+        self._local = threading.local()
+        self._export_thread = None
+        self._export_stop = threading.Event()
+
+    def register_cache(self, name, cache):
+        self.caches[name] = cache
+
+    @contextmanager
+    def timer(self, stage, ticker = None):
+        '''Times the block as one call of stage, charged to ticker if given'''
+        depth = getattr(self._local, "depth", 0)
+        if ticker is not None:
+            self._local.depth = depth + 1
+        started = time.time()
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            self.record_stage(stage, time.time() - started, ticker, nested=depth > 0)
+
+    def record_stage(self, stage, seconds, ticker = None, nested = False):
+        '''Adds a call of stage timed elsewhere, e.g. in a worker process; a
+           nested call is not added to the ticker's total again'''
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            if ticker is not None:
+                per_ticker = self.tickers.setdefault(ticker, {})
+                per_ticker[stage] = per_ticker.get(stage, 0.0) + seconds
+                if not nested:
+                    self.ticker_seconds[ticker] = self.ticker_seconds.get(ticker, 0.0) + seconds
+
+    def record_request(self, host, seconds, size = 0, status = None):
+        with self._lock:
+            entry = self.hosts.setdefault(host, {"requests": 0, "seconds": 0.0, "bytes": 0, "errors": 0})
+            entry["requests"] += 1
+            entry["seconds"] += seconds
+            entry["bytes"] += size
+            if status is None or status >= 400:
+                entry["errors"] += 1
+
+    def count(self, name, n = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        elapsed = time.time() - self.started
+        with self._lock:
+            stages = {stage: dict(entry) for stage, entry in self.stages.items()}
+            hosts = {host: dict(entry) for host, entry in self.hosts.items()}
+            counters = dict(self.counters)
+            tickers = {ticker: dict(times) for ticker, times in self.tickers.items()}
+            ticker_seconds = dict(self.ticker_seconds)
+        caches = {}
+        for name, cache in self.caches.items():
+            lookups = cache.hits + cache.misses
+            caches[name] = {"hits": cache.hits, "misses": cache.misses,
+                            "hit_rate": cache.hits/lookups if lookups else None}
+        scanned = stages.get("get_cash_flow_pg", {}).get("calls", 0)
+        return {"elapsed_seconds": elapsed,
+                "tickers_scanned": scanned,
+                "tickers_per_minute": 60*scanned/elapsed if elapsed else 0.0,
+                "stages": stages, "hosts": hosts, "counters": counters, "caches": caches,
+                "tickers": tickers, "ticker_seconds": ticker_seconds}
+
+    def prometheus_text(self, snapshot = None):
+        '''The snapshot in the Prometheus text exposition format'''
+        snapshot = snapshot or self.snapshot()
+        lines = ["# TYPE dcf_tickers_per_minute gauge",
+                 f"dcf_tickers_per_minute {snapshot['tickers_per_minute']}",
+                 "# TYPE dcf_tickers_scanned_total counter",
+                 f"dcf_tickers_scanned_total {snapshot['tickers_scanned']}"]
+        for metric, key in (("dcf_stage_calls_total", "calls"), ("dcf_stage_seconds_total", "seconds")):
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f'{metric}{{stage="{_label(stage)}"}} {entry[key]}' for stage, entry in snapshot["stages"].items()]
+        for key in ("requests", "seconds", "bytes", "errors"):
+            metric = f"dcf_host_{key}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f'{metric}{{host="{_label(host)}"}} {entry[key]}' for host, entry in snapshot["hosts"].items()]
+        lines.append("# TYPE dcf_events_total counter")
+        lines += [f'dcf_events_total{{event="{_label(name)}"}} {value}' for name, value in snapshot["counters"].items()]
+        lines.append("# TYPE dcf_cache_hit_rate gauge")
+        lines += [f'dcf_cache_hit_rate{{cache="{_label(name)}"}} {entry["hit_rate"]}'
+                  for name, entry in snapshot["caches"].items() if entry["hit_rate"] is not None]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory, prefix = ""):
+        '''Writes <prefix>metrics.json and <prefix>metrics.prom into directory'''
+        snapshot = self.snapshot()
+        os.makedirs(directory, exist_ok=True)
+        write_atomic(os.path.join(directory, prefix + "metrics.json"), json.dumps(snapshot, indent=1))
+        write_atomic(os.path.join(directory, prefix + "metrics.prom"), self.prometheus_text(snapshot))
+        return snapshot
+
+    def start_export(self, directory, prefix = "", interval = 30):
+        '''Rewrites the snapshot files every interval seconds until stop_export()'''
+        def export():
+            while not self._export_stop.wait(interval):
+                self.write(directory, prefix)
+
+        self._export_stop.clear()
+        self._export_thread = threading.Thread(target=export, daemon=True)
+        self._export_thread.start()
+
+    def stop_export(self, directory, prefix = ""):
+        '''Stops the periodic export and writes the final snapshot'''
+        if self._export_thread is not None:
+            self._export_stop.set()
+            self._export_thread.join()
+            self._export_thread = None
+        return self.write(directory, prefix)
+
+    def summary(self, top = 10):
+        '''Printable end-of-run summary: stages and hosts by time, counters,
+           cache hit rates and the slowest tickers'''
+        snapshot = self.snapshot()
+        lines = [f"{snapshot['tickers_scanned']} tickers in {snapshot['elapsed_seconds']:.1f} s "
+                 f"({snapshot['tickers_per_minute']:.1f} per minute)",
+                 "stages:"]
+        for stage, entry in sorted(snapshot["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"  {stage}: {entry['calls']} calls, {entry['seconds']:.1f} s, "
+                         f"max {entry['max_seconds']:.2f} s")
+        lines.append("hosts:")
+        for host, entry in sorted(snapshot["hosts"].items(), key=lambda item: -item[1]["seconds"]):
+            average = entry["seconds"]/entry["requests"] if entry["requests"] else 0
+            lines.append(f"  {host}: {entry['requests']} requests, {entry['seconds']:.1f} s "
+                         f"(avg {average:.2f} s), {entry['bytes']/1e6:.1f} MB, {entry['errors']} errors")
+        if snapshot["counters"]:
+            lines.append("counters: " + ", ".join(f"{name}={value}" for name, value in sorted(snapshot["counters"].items())))
+        for name, entry in snapshot["caches"].items():
+            if entry["hit_rate"] is not None:
+                lines.append(f"cache {name}: {entry['hit_rate']:.0%} hits of {entry['hits'] + entry['misses']} lookups")
+        slowest = sorted(snapshot["ticker_seconds"].items(), key=lambda item: -item[1])[:top]
+        if slowest:
+            lines.append("slowest tickers:")
+            lines += [f"  {ticker}: {seconds:.2f} s" for ticker, seconds in slowest]
+        return "\n".join(lines)
+
+
+def timed(stage):
+    '''Decorator timing a StockInfo method as stage in self.metrics, and
+       profiling it when self.profiler is set (see profiling.Profiler); the
+       first argument is taken as the ticker when it is a string'''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            ticker = args[0] if args and isinstance(args[0], str) and "://" not in args[0] else None
+            with self.metrics.timer(stage, ticker):
+                if self.profiler is None:
+                    return method(self, *args, **kwargs)
+                with self.profiler.stage(stage):
+                    return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
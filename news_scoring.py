@@ -0,0 +1,120 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from lazy_imports import lazy_import
+
+nltk = lazy_import("nltk")
+nltk_vader = lazy_import("nltk.sentiment.vader")
+pd = lazy_import("pandas")
+
+SCORE_COLUMNS = ['neg', 'neu', 'pos', 'compound']
+VADER_LEXICON_RESOURCE = "sentiment/vader_lexicon.zip"
+
+
+def _load_analyzer(lexicon_file):
+    lexicon_file = lexicon_file or os.environ.get("VADER_LEXICON")
+    if lexicon_file:
+        # read here rather than through nltk.data.load: newer nltk refuses "file:" urls
+        # outside its data directories
+        analyzer = nltk_vader.SentimentIntensityAnalyzer.__new__(nltk_vader.SentimentIntensityAnalyzer)
+        with open(lexicon_file, encoding="utf-8") as f:
+            analyzer.lexicon_file = f.read().strip()
+        analyzer.lexicon = analyzer.make_lex_dict()
+        analyzer.constants = nltk_vader.VaderConstants()
+        return analyzer
+
+    try:
+        nltk.data.find(VADER_LEXICON_RESOURCE)
+    except LookupError:
+        nltk.download("vader_lexicon")
+    return nltk_vader.SentimentIntensityAnalyzer()
+
+
+# analyzer of a scoring worker process, loaded once by the pool initializer
+_worker_analyzer = None
+
+
+def _init_worker(lexicon_file):
+    global _worker_analyzer
+    _worker_analyzer = _load_analyzer(lexicon_file)
+
+
+def _score_chunk(headlines):
+    return [_worker_analyzer.polarity_scores(headline) for headline in headlines]
+
+
+class NewsScorer:
+    '''VADER headline scorer that loads its lexicon once and is meant to be kept
+       for the whole run (see get_news_scorer).
+
+       The lexicon is taken from lexicon_file, or the VADER_LEXICON environment
+       variable, when given - a local copy of vader_lexicon.txt, so scoring works
+       offline. Otherwise the nltk data directories are searched and the lexicon
+       is downloaded only if it is not installed yet.
+
+       With processes > 1, batches larger than chunk_size are split into chunks
+       scored on a process pool whose workers load the lexicon once each;
+       processes=0 uses all cores. The pool lives until close(), or the end of a
+       with block.
+    '''
+
+    def __init__(self, lexicon_file = None, processes = 1, chunk_size = 2000):
+        self.lexicon_file = lexicon_file
+        self.processes = processes if processes else os.cpu_count()
+        self.chunk_size = chunk_size
+        self.analyzer = _load_analyzer(lexicon_file)
+        self._pool = None
+
+    def score(self, headlines):
+        '''Scores a batch of headlines. Returns a data frame of SCORE_COLUMNS in the
+           order of the headlines.
+
+           @param: headlines - iterable of str
+        '''
+        headlines = list(headlines)
+        if self.processes > 1 and len(headlines) > self.chunk_size:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                                 initargs=(self.lexicon_file,))
+            # a few chunks per worker keeps all cores busy until the end
+            chunk_size = max(min(self.chunk_size, -(-len(headlines) // (self.processes*4))), 200)
+            chunks = [headlines[i:i + chunk_size] for i in range(0, len(headlines), chunk_size)]
+            # map returns the chunks in submission order
+            scores = [score for chunk_scores in self._pool.map(_score_chunk, chunks) for score in chunk_scores]
+        else:
+            polarity_scores = self.analyzer.polarity_scores
+            scores = [polarity_scores(headline) for headline in headlines]
+        return pd.DataFrame(scores, columns=SCORE_COLUMNS)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_news_scorer(lexicon_file = None, processes = None):
+    '''Returns the process-wide single-process NewsScorer, creating it on first
+       use; with processes given, a separate scorer of its own the caller has
+       to close()
+
+       @param: lexicon_file = None - only used when a scorer is created
+       @param: processes = None - see NewsScorer
+    '''
+    global _scorer
+    if processes is not None:
+        return NewsScorer(lexicon_file, processes)
+    with _scorer_lock:
+        if _scorer is None:
+            _scorer = NewsScorer(lexicon_file)
+        return _scorer
@@ -0,0 +1,251 @@
+import os
+import sqlite3
+from datetime import datetime
+
+from cache import DEFAULT_CACHE_DIR
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+DEFAULT_NEWS_STORE = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), "news.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    guid TEXT PRIMARY KEY,
+    published TEXT,
+    date TEXT,
+    time TEXT,
+    headline TEXT,
+    neg REAL,
+    neu REAL,
+    pos REAL,
+    compound REAL,
+    scored_at TEXT
+);
+CREATE TABLE IF NOT EXISTS article_tickers (
+    guid TEXT,
+    ticker TEXT,
+    PRIMARY KEY (guid, ticker)
+);
+CREATE INDEX IF NOT EXISTS articles_compound ON articles (compound);
+CREATE INDEX IF NOT EXISTS articles_scored_at ON articles (scored_at);
+CREATE INDEX IF NOT EXISTS articles_published ON articles (published);
+CREATE INDEX IF NOT EXISTS article_tickers_ticker ON article_tickers (ticker);
+CREATE TABLE IF NOT EXISTS daily_sentiment (
+    ticker TEXT,
+    date TEXT,
+    count INTEGER,
+    compound_sum REAL,
+    compound_min REAL,
+    compound_max REAL,
+    PRIMARY KEY (ticker, date)
+);
+CREATE INDEX IF NOT EXISTS daily_sentiment_date ON daily_sentiment (date);
+"""
+
+# PRAGMA user_version of a store whose daily_sentiment has been built from its articles
+SCHEMA_VERSION = 1
+
+_ADD_TO_DAILY_SENTIMENT = """
+INSERT INTO daily_sentiment (ticker, date, count, compound_sum, compound_min, compound_max)
+SELECT ?, date, 1, compound, compound, compound FROM articles WHERE guid = ?
+ON CONFLICT (ticker, date) DO UPDATE SET
+    count = count + 1,
+    compound_sum = compound_sum + excluded.compound_sum,
+    compound_min = min(compound_min, excluded.compound_min),
+    compound_max = max(compound_max, excluded.compound_max)
+"""
+
+
+class NewsStore:
+    '''Local SQLite store of scored headlines keyed by article GUID (the feed
+       entry's id, or its link).
+
+       Feeds are checked against it before scoring so that only headlines never
+       seen before are scored; an article seen again in another ticker's feed only
+       adds a row to article_tickers. The general news feed is stored with an
+       empty ticker.
+
+       Every new (article, ticker) pair is also added to that ticker's day in
+       daily_sentiment (headline count, compound sum, min and max), so the
+       per-ticker sentiment series never has to be recomputed from all headlines.
+    '''
+
+    def __init__(self, path = None):
+        self.path = path or DEFAULT_NEWS_STORE
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(_SCHEMA)
+        # stores created before daily_sentiment existed get it built once
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self.rebuild_sentiment()
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.connection.close()
+
+    def unseen(self, guids):
+        '''Returns the subset of guids that are not in the store yet'''
+        guids = list(set(guids))
+        seen = set()
+        for i in range(0, len(guids), 500):
+            chunk = guids[i:i + 500]
+            query = "SELECT guid FROM articles WHERE guid IN ({})".format(",".join("?" * len(chunk)))
+            seen.update(row[0] for row in self.connection.execute(query, chunk))
+        return set(guids) - seen
+
+    def add_tickers(self, guid_tickers):
+        '''Maps already stored articles to more tickers; pairs of articles not in
+           the store are skipped
+
+           @param: guid_tickers - iterable of (guid, ticker)
+        '''
+        with self.connection:
+            self._add_tickers(guid_tickers)
+
+    def _add_tickers(self, guid_tickers):
+        # a pair is only mapped once its article is stored, otherwise daily_sentiment
+        # would miss it and a later add() would ignore the existing pair
+        for guid, ticker in guid_tickers:
+            cursor = self.connection.execute("""INSERT OR IGNORE INTO article_tickers (guid, ticker)
+                                                SELECT ?, ? WHERE EXISTS (SELECT 1 FROM articles WHERE guid = ?)""",
+                                             (guid, ticker, guid))
+            if cursor.rowcount == 1 and ticker:
+                self.connection.execute(_ADD_TO_DAILY_SENTIMENT, (ticker, guid))
+
+    def add(self, scored_news, guid_tickers = ()):
+        '''Stores scored headlines, see stock_news.score_yf_news, and maps them
+           (or already stored articles) to the tickers of guid_tickers in the same
+           transaction
+
+           @param: scored_news - data frame with guid, ticker, date, time, headline,
+                                 neg, neu, pos and compound columns
+           @param: guid_tickers = () - iterable of (guid, ticker), e.g. the other
+                                       feeds an article of scored_news was found in
+        '''
+        scored_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        articles = [(row.guid, f"{row.date} {row.time}", str(row.date), str(row.time), row.headline,
+                     float(row.neg), float(row.neu), float(row.pos), float(row.compound), scored_at)
+                    for row in scored_news.itertuples(index=False)]
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", articles)
+            self._add_tickers(zip(scored_news["guid"], scored_news["ticker"]))
+            self._add_tickers(guid_tickers)
+        return scored_at
+
+    def rebuild_sentiment(self):
+        '''Recomputes daily_sentiment from all stored headlines; only needed for
+           stores created before the table existed'''
+        with self.connection:
+            self.connection.execute("DELETE FROM daily_sentiment")
+            self.connection.execute("""
+                INSERT INTO daily_sentiment (ticker, date, count, compound_sum, compound_min, compound_max)
+                SELECT t.ticker, a.date, count(*), sum(a.compound), min(a.compound), max(a.compound)
+                FROM articles a JOIN article_tickers t ON t.guid = a.guid
+                WHERE t.ticker != ''
+                GROUP BY t.ticker, a.date""")
+
+    def sentiment_series(self, ticker = None, start = None, windows = (7, 30)):
+        '''Per-ticker daily sentiment: headline count, mean and extreme (largest in
+           magnitude) compound score, plus their rolling means over each window of
+           calendar days. Only the days needed for the windows are read.
+
+           @param: ticker = None - all tickers if None
+           @param: start = None - first date to return, "YYYY-MM-DD"
+           @param: windows = (7, 30) - rolling window lengths in days
+        '''
+        query = "SELECT ticker, date, count, compound_sum, compound_min, compound_max FROM daily_sentiment WHERE 1"
+        params = []
+        if start is not None:
+            query += " AND date >= ?"
+            params.append((pd.Timestamp(start) - pd.Timedelta(days=max(windows) - 1)).strftime("%Y-%m-%d"))
+        if ticker is not None:
+            query += " AND ticker = ?"
+            params.append(ticker)
+        daily = pd.read_sql_query(query + " ORDER BY ticker, date", self.connection, params=params)
+
+        daily["date"] = pd.to_datetime(daily["date"])
+        daily["mean"] = daily["compound_sum"] / daily["count"]
+        daily["extreme"] = daily["compound_max"].where(daily["compound_max"].abs() >= daily["compound_min"].abs(),
+                                                       daily["compound_min"])
+        daily = daily.set_index("date")
+        for window in windows:
+            rolling = daily.groupby("ticker")[["count", "compound_sum"]].rolling(f"{window}D").sum()
+            rolling = rolling.reset_index(level=0, drop=True)
+            daily[f"count_{window}d"] = rolling["count"].values
+            daily[f"mean_{window}d"] = (rolling["compound_sum"] / rolling["count"]).values
+
+        daily = daily.reset_index().drop(columns=["compound_sum", "compound_min", "compound_max"])
+        if start is not None:
+            daily = daily[daily["date"] >= pd.Timestamp(start)]
+        return daily.reset_index(drop=True)
+
+    def sentiment_snapshot(self, as_of = None, windows = (7, 30)):
+        '''One row per ticker with the headline count, mean and extreme compound
+           score of the last 7 and 30 days (windows), and sentiment_turn - the
+           short minus the long window mean. Indexed by ticker, so it joins with
+           valuation frames such as StockInfo.valuation.get("valuation").
+
+           @param: as_of = None - last day included, today if None
+           @param: windows = (7, 30)
+        '''
+        as_of = pd.Timestamp(as_of or datetime.now().date())
+        first_day = as_of - pd.Timedelta(days=max(windows) - 1)
+        daily = pd.read_sql_query("""SELECT ticker, date, count, compound_sum, compound_min, compound_max
+                                     FROM daily_sentiment WHERE date >= ? AND date <= ?""",
+                                  self.connection,
+                                  params=[first_day.strftime("%Y-%m-%d"), as_of.strftime("%Y-%m-%d")])
+
+        snapshot = pd.DataFrame(index=pd.Index(sorted(daily["ticker"].unique()), name="ticker"))
+        for window in windows:
+            recent = daily[daily["date"] >= (as_of - pd.Timedelta(days=window - 1)).strftime("%Y-%m-%d")]
+            grouped = recent.groupby("ticker")
+            count = grouped["count"].sum()
+            compound_min = grouped["compound_min"].min()
+            compound_max = grouped["compound_max"].max()
+            snapshot[f"count_{window}d"] = count
+            snapshot[f"mean_{window}d"] = grouped["compound_sum"].sum() / count
+            snapshot[f"extreme_{window}d"] = compound_max.where(compound_max.abs() >= compound_min.abs(), compound_min)
+        snapshot[[f"count_{window}d" for window in windows]] = snapshot[[f"count_{window}d" for window in windows]].fillna(0)
+        snapshot["sentiment_turn"] = snapshot[f"mean_{min(windows)}d"] - snapshot[f"mean_{max(windows)}d"]
+        return snapshot
+
+    def query(self, score_threshold, scored_since = None, ticker = None):
+        '''Headlines whose compound score is above score_threshold or below
+           -score_threshold, newest first. Every headline is one row whose ticker
+           column lists all tickers it was found for, comma separated (None for
+           the general news feed only).
+
+           @param: score_threshold
+           @param: scored_since = None - only headlines scored at or after this
+                                         "YYYY-MM-DD HH:MM:SS" time
+           @param: ticker = None
+        '''
+        query = """SELECT group_concat(NULLIF(t.ticker, ''), ',') AS ticker, a.date, a.time, a.headline, a.neg, a.neu, a.pos, a.compound, a.guid
+                   FROM articles a JOIN article_tickers t ON t.guid = a.guid
+                   WHERE (a.compound > ? OR a.compound < ?)"""
+        params = [score_threshold, -score_threshold]
+        if scored_since is not None:
+            query += " AND a.scored_at >= ?"
+            params.append(scored_since)
+        if ticker is not None:
+            query += " AND t.ticker = ?"
+            params.append(ticker)
+        query += " GROUP BY a.guid ORDER BY a.published DESC"
+        return pd.read_sql_query(query, self.connection, params=params)
+
+
+def screen_cheap_turning(valuation, sentiment, min_upside = 0.2, min_turn = 0.1, min_count = 3):
+    '''Tickers that look cheap on the DCF and whose news sentiment is improving
+
+       @param: valuation - ticker-indexed frame with an upside column, e.g.
+                           StockInfo.valuation.get("valuation")
+       @param: sentiment - NewsStore.sentiment_snapshot()
+       @param: min_upside = 0.2 - intrinsic value over price, minus one
+       @param: min_turn = 0.1 - short minus long window mean compound score
+       @param: min_count = 3 - headlines needed in the short window
+    '''
+    joined = valuation.join(sentiment, how="inner")
+    short_count = [column for column in sentiment.columns if column.startswith("count_")][0]
+    selected = (joined["upside"] >= min_upside) & (joined["sentiment_turn"] >= min_turn) & (joined[short_count] >= min_count)
+    return joined[selected].sort_values("sentiment_turn", ascending=False)
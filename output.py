@@ -0,0 +1,140 @@
+import datetime
+import glob
+import os
+
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".arrow"}
+
+
+def _pyarrow_dataset():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except Exception:
+        print("""Warning - Parquet and Arrow output
+             requires pyarrow, which is not installed.
+
+             Install using:
+             pip install pyarrow""")
+        raise
+    return pyarrow, pyarrow.dataset
+
+
+def ticker_table_dtypes(frame, ticker_column = "Ticker"):
+    '''dtypes of a per-ticker table: string tickers, float64 values'''
+    dtypes = {column: "float64" for column in frame.columns}
+    dtypes[ticker_column] = "string"
+    return dtypes
+
+
+class OutputWriter:
+    '''Writes the result tables of a run into one directory.
+
+       "csv" keeps the original layout, one <run time>_<name>.csv per table with
+       the frame's index. "parquet" and "feather" (Arrow IPC) write a dataset per
+       table, partitioned by run date:
+
+           <directory>/<name>/run_date=YYYY-MM-DD/<run time>.parquet
+
+       with explicit column dtypes and compression, so read() can load many runs
+       reading only the columns asked for.
+    '''
+
+    def __init__(self, directory, format = "csv", compression = "zstd", run_time = None):
+        '''@param: directory
+           @param: format = "csv" - one of FORMATS
+           @param: compression = "zstd" - parquet/feather codec, ignored for csv
+           @param: run_time = None - datetime of the run, now if None
+        '''
+        if format not in FORMATS:
+            raise AssertionError(f"format must be one of {list(FORMATS)}")
+        self.directory = directory
+        self.format = format
+        self.compression = compression
+        self.run_time = run_time or datetime.datetime.now()
+
+    @property
+    def run_string(self):
+        return self.run_time.strftime("%Y%m%d_%H%M%S")
+
+    def write(self, frame, name, dtypes = None):
+        '''Writes a result table and returns its path
+
+           @param: frame
+           @param: name - e.g. "cash_flow"
+           @param: dtypes = None - column -> dtype, applied before writing
+        '''
+        if dtypes:
+            frame = frame.astype({column: dtype for column, dtype in dtypes.items() if column in frame.columns})
+
+        if self.format == "csv":
+            os.makedirs(self.directory, exist_ok=True)
+            fname = os.path.join(self.directory, f"{self.run_string}_{name}.csv")
+            print(f"saving into {fname}")
+            frame.to_csv(fname)
+            return fname
+
+        partition = os.path.join(self.directory, name, "run_date=" + self.run_time.strftime("%Y-%m-%d"))
+        os.makedirs(partition, exist_ok=True)
+        fname = os.path.join(partition, self.run_string + FORMATS[self.format])
+        print(f"saving into {fname}")
+        # a named index (ticker) becomes a column, a plain range index is dropped
+        if frame.index.name is not None:
+            frame = frame.reset_index()
+        else:
+            frame = frame.reset_index(drop=True)
+        _pyarrow_dataset()
+        if self.format == "parquet":
+            frame.to_parquet(fname, engine="pyarrow", compression=self.compression, index=False)
+        else:
+            frame.to_feather(fname, compression=self.compression)
+        return fname
+
+    def read(self, name, columns = None, start_date = None, end_date = None):
+        '''Loads a table of all runs between the "YYYY-MM-DD" dates (inclusive),
+           with a run_date column
+
+           @param: name
+           @param: columns = None - all if None
+           @param: start_date = None
+           @param: end_date = None
+        '''
+        if self.format == "csv":
+            frames = []
+            for fname in sorted(glob.glob(os.path.join(self.directory, f"*_{name}.csv"))):
+                stamp = os.path.basename(fname)[:8]
+                run_date = f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]}"
+                if (start_date and run_date < start_date) or (end_date and run_date > end_date):
+                    continue
+                frame = pd.read_csv(fname, index_col=0)
+                if columns is not None:
+                    frame = frame.reindex(columns=list(columns))
+                frame["run_date"] = run_date
+                frames.append(frame)
+            return pd.concat(frames) if frames else pd.DataFrame(columns=list(columns or []) + ["run_date"])
+
+        pa, ds = _pyarrow_dataset()
+        path = os.path.join(self.directory, name)
+        file_format = "parquet" if self.format == "parquet" else "ipc"
+        run_date = pa.schema([("run_date", pa.string())])
+        partitioning = ds.partitioning(run_date, flavor="hive")
+        # runs may have different columns (e.g. the years of a growth table): the
+        # schema of all files, not just the first one, missing columns read as null
+        schemas = [fragment.physical_schema for fragment in
+                   ds.dataset(path, format=file_format, partitioning=partitioning).get_fragments()]
+        if not schemas:
+            return pd.DataFrame(columns=list(columns or []) + ["run_date"])
+        dataset = ds.dataset(path, schema=pa.unify_schemas(schemas + [run_date]),
+                             format=file_format, partitioning=partitioning)
+        condition = None
+        if start_date:
+            condition = ds.field("run_date") >= start_date
+        if end_date:
+            upper = ds.field("run_date") <= end_date
+            condition = upper if condition is None else condition & upper
+        if columns is not None:
+            columns = list(columns) + ["run_date"]
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
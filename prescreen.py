@@ -0,0 +1,72 @@
+import operator
+
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+# page requests a ticker costs once it is scraped: cash-flow, financials and analysis pages,
+# plus MarketWatch financials, balance sheet and quote page for its WACC
+REQUESTS_PER_TICKER = 6
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+             "==": operator.eq, "!=": operator.ne,
+             "in": lambda column, values: column.isin(values),
+             "not in": lambda column, values: ~column.isin(values)}
+
+# (v7 quote field, operator, value)
+DEFAULT_FILTERS = [("quoteType", "in", ["EQUITY"]),
+                   ("marketCap", ">=", 50_000_000)]
+
+
+class PreScreen:
+    '''Cheap stage in front of the per-ticker scrape: drops tickers that cannot
+       pass collect_statements anyway, using quote fields fetched for the whole
+       list with StockInfo.get_quote_data_batch.
+
+       filters is a list of (quote field, operator, value) with an operator from
+       OPERATORS, e.g. ("epsTrailingTwelveMonths", ">", 0). A ticker is kept when
+       it passes all filters; a missing value fails its filter, but a field Yahoo
+       did not return for any ticker is skipped. After run(), self.report has the
+       reason every dropped ticker was dropped for (None before).
+
+       When the quotes cannot be fetched, every ticker is passed through: the
+       pre-screen only saves requests, it must not cost the scan.
+    '''
+
+    def __init__(self, stock_info, filters = None):
+        self.stock_info = stock_info
+        self.filters = DEFAULT_FILTERS if filters is None else filters
+        # set by run(), not here: creating a StockInfo must not import pandas
+        self.report = None
+        self.saved_requests = 0
+
+    def run(self, tickers):
+        '''Returns the tickers passing the filters, in their original order'''
+        tickers = list(tickers)
+        try:
+            quotes = self.stock_info.get_quote_data_batch(tickers).reindex(tickers)
+        except Exception as e:
+            print(f"pre-screen: fetching quotes FAILED, keeping all {len(tickers)} tickers: {e}")
+            self.report = pd.DataFrame(columns=["reason"])
+            self.saved_requests = 0
+            return tickers
+
+        reasons = pd.Series(None, index=quotes.index, dtype=object)
+        if "quoteType" in quotes.columns:
+            reasons[quotes["quoteType"].isna()] = "no quote"
+        for field, op, value in self.filters:
+            if field not in quotes.columns:
+                print(f"pre-screen: quote field {field} not available, filter skipped")
+                continue
+            passed = OPERATORS[op](quotes[field], value) & quotes[field].notna()
+            reasons[~passed & reasons.isna()] = f"{field} {op} {value}"
+
+        dropped = reasons.notna()
+        self.report = pd.DataFrame({"reason": reasons[dropped]})
+        quote_requests = -(-len(tickers) // 500)
+        self.saved_requests = int(dropped.sum()) * REQUESTS_PER_TICKER - quote_requests
+
+        survivors = [ticker for ticker, drop in zip(tickers, dropped) if not drop]
+        print(f"pre-screen kept {len(survivors)} of {len(tickers)} tickers, "
+              f"saving about {self.saved_requests} page requests")
+        return survivors
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# StockInfo stages (see metrics.timed) profiled by default
+DEFAULT_STAGES = ("get_cash_flow_pg", "_parse_json", "collect_statements", "calc_wacc", "get_marketwatch_data")
+
+
+def parse_sample(text):
+    '''A profile sample given on the command line or in an environment variable:
+       "20" -> 20 tickers, "AAPL,MSFT" -> those tickers, "" -> None (no profiling)'''
+    text = (text or "").strip()
+    if not text:
+        return None
+    if text.isdigit():
+        return int(text)
+    return [ticker.strip() for ticker in text.split(",") if ticker.strip()]
+
+
+def sample_tickers(tickers, sample):
+    '''sample evenly spaced tickers of the list when sample is a number, the
+       listed tickers in scan order when it is a list'''
+    tickers = list(tickers)
+    if isinstance(sample, int):
+        step = max(1, len(tickers) // max(sample, 1))
+        return tickers[::step][:sample]
+    wanted = set(sample)
+    return [ticker for ticker in tickers if ticker in wanted]
+
+
+class Profiler:
+    '''cProfile and tracemalloc per stage, for the thread that created it.
+
+       Every stage has its own cProfile.Profile. When a profiled stage calls
+       another one (get_cash_flow_pg -> collect_statements -> _parse_json) the
+       outer profile is paused, so a stage's functions are only the ones it runs
+       itself. Allocations are measured as the growth of traced memory over each
+       call and include nested stages. Calls from other threads are not
+       profiled.
+    '''
+
+    def __init__(self, stages = DEFAULT_STAGES, memory = True, frames = 5):
+        self.stages = set(stages)
+        self.memory = memory
+        self.frames = frames
+        self.profiles = {}
+        # stage -> {allocation site: bytes grown}
+        self.allocations = {}
+        self._thread = threading.current_thread()
+        self._stack = []
+
+    def start(self):
+        if self.memory:
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _snapshot(self):
+        # without the profiler's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__)])
+
+    @contextmanager
+    def stage(self, stage):
+        if stage not in self.stages or threading.current_thread() is not self._thread:
+            yield
+            return
+
+        if self._stack:
+            self._stack[-1].disable()
+        profile = self.profiles.setdefault(stage, cProfile.Profile())
+        self._stack.append(profile)
+        before = self._snapshot() if self.memory and tracemalloc.is_tracing() else None
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._stack.pop()
+            if before is not None:
+                sites = self.allocations.setdefault(stage, {})
+                for diff in self._snapshot().compare_to(before, "lineno"):
+                    if diff.size_diff > 0:
+                        site = str(diff.traceback[0])
+                        sites[site] = sites.get(site, 0) + diff.size_diff
+            if self._stack:
+                self._stack[-1].enable()
+
+    def write_reports(self, directory, top = 20):
+        '''Writes <stage>.pstats (load with pstats.Stats) and <stage>_allocations.txt
+           for every profiled stage, an allocations.snapshot of the traced memory
+           and summary.txt with the top functions and allocation sites of each
+           stage; returns the summary'''
+        os.makedirs(directory, exist_ok=True)
+        summary = []
+        for stage, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(directory, stage + ".pstats"))
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats("tottime").print_stats(top)
+            summary += [f"===== {stage}: top {top} functions by own time =====", text.getvalue()]
+
+            sites = sorted(self.allocations.get(stage, {}).items(), key=lambda item: -item[1])
+            if sites:
+                lines = [f"{size/1024:10.1f} KiB  {site}" for site, size in sites]
+                with open(os.path.join(directory, stage + "_allocations.txt"), "w") as f:
+                    f.write("\n".join(lines) + "\n")
+                summary += [f"===== {stage}: top {top} allocation sites =====", "\n".join(lines[:top]), ""]
+
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.take_snapshot().dump(os.path.join(directory, "allocations.snapshot"))
+
+        summary = "\n".join(summary)
+        with open(os.path.join(directory, "summary.txt"), "w") as f:
+            f.write(summary)
+        print(f"profile written into {directory}")
+        return summary
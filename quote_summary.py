@@ -0,0 +1,25 @@
+import json
+import re
+
+
+def parse_quote_summary(html, keys = None):
+    '''QuoteSummaryStore of a Yahoo quote page (the "root.App.main" JSON), with
+       {"raw": ..., "fmt": ...} values flattened to their raw value and empty
+       objects turned into None. A plain function of the page text, so it can
+       run in worker processes.
+
+       @param: html
+       @param: keys = None - store entries to keep, all if None
+    '''
+    json_str = html.split('root.App.main =')[1].split(
+        '(this)')[0].split(';\n}')[0].strip()
+    data = json.loads(json_str)[
+        'context']['dispatcher']['stores']['QuoteSummaryStore']
+
+    new_data = json.dumps(data).replace('{}', 'null')
+    new_data = re.sub(r'\{[\'|\"]raw[\'|\"]:(.*?),(.*?)\}', r'\1', new_data)
+
+    json_info = json.loads(new_data)
+    if keys is not None:
+        json_info = {key: json_info[key] for key in keys if key in json_info}
+    return json_info
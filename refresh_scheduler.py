@@ -0,0 +1,81 @@
+import datetime
+import time
+
+from cache import FileCache
+
+
+class RefreshScheduler:
+    '''Decides which tickers' annual fundamentals may have changed since they were
+       last fetched, so that only those are scraped again and the rest is served
+       from the fundamentals cache (see StockInfo._fundamentals_json).
+
+       A ticker is due when it was never fetched, when its last fetch is older
+       than max_age days, when the earnings calendar lists it as reporting since
+       its last fetch, or when its cached next earnings date has passed since
+       then. Next earnings dates are cached until they pass.
+    '''
+
+    def __init__(self, stock_info, max_age = 365, cache_dir = None):
+        self.stock_info = stock_info
+        self.max_age = max_age
+        self.fetched = FileCache("refresh_schedule", cache_dir=cache_dir)
+        self.reasons = {}
+
+    def last_fetched(self, ticker):
+        return self.fetched.stored_at("fetched_" + ticker)
+
+    def mark_fetched(self, ticker, check_next_earnings = True):
+        '''Records a successful fetch of the ticker's fundamentals and, optionally,
+           looks up its next earnings date for the following runs'''
+        self.fetched.set("fetched_" + ticker, True)
+        if check_next_earnings:
+            try:
+                # a quote page request of its own, paced with the scan's fetches
+                self.stock_info.throttle()
+                next_date = self.stock_info.get_next_earnings_date(ticker)
+                self.fetched.set("next_earnings_" + ticker, next_date.timestamp())
+            except Exception as e:
+                pass
+
+    def reporters_between(self, start_date, end_date):
+        '''Tickers on the earnings calendar from start_date to end_date, inclusive,
+           mapped to their latest "YYYY-MM-DD" report date in that range; the
+           calendar days themselves are cached by get_earnings_for_date'''
+        start = start_date.strftime("%Y-%m-%d")
+        end = end_date.strftime("%Y-%m-%d")
+        reporters = {}
+        for row in self.stock_info.get_earnings_in_date_range(start, end):
+            if not row.get("ticker"):
+                continue
+            report_date = str(row.get("startdatetime") or end)[:10]
+            reporters[row["ticker"]] = max(report_date, reporters.get(row["ticker"], report_date))
+        return reporters
+
+    def schedule(self, tickers):
+        '''Returns the tickers due for a refresh, in their original order; the
+           reason for each is kept in self.reasons'''
+        now = time.time()
+        oldest_allowed = now - self.max_age*24*3600
+
+        last_fetched = {ticker: self.last_fetched(ticker) for ticker in tickers}
+        known = [fetched for fetched in last_fetched.values() if fetched is not None and fetched >= oldest_allowed]
+        reporters = {}
+        if known:
+            reporters = self.reporters_between(datetime.date.fromtimestamp(min(known)), datetime.date.today())
+
+        self.reasons = {}
+        for ticker in tickers:
+            fetched = last_fetched[ticker]
+            next_earnings = self.fetched.get("next_earnings_" + ticker)
+            if fetched is None:
+                self.reasons[ticker] = "never fetched"
+            elif fetched < oldest_allowed:
+                self.reasons[ticker] = f"older than {self.max_age} days"
+            elif next_earnings is not None and fetched < next_earnings <= now:
+                self.reasons[ticker] = "next earnings date passed"
+            elif ticker in reporters and reporters[ticker] >= datetime.date.fromtimestamp(fetched).isoformat():
+                self.reasons[ticker] = "reported since last fetch"
+
+        due = [ticker for ticker in tickers if ticker in self.reasons]
+        print(f"refresh scheduler: {len(due)} of {len(tickers)} tickers due, the rest served from cache")
+        return due
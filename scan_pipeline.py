@@ -0,0 +1,281 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from quote_summary import parse_quote_summary
+
+# quote sub-pages get_cash_flow_pg and collect_statements read, with the store entries kept
+PAGES = {"cash-flow": ["cashflowStatementHistory"],
+         "financials": ["incomeStatementHistory"],
+         "analysis": ["earningsTrend"]}
+
+_DONE = object()
+
+
+def _parse_pages(pages):
+    '''{page: html} -> ({page: selected QuoteSummaryStore entries, None if the page
+       could not be parsed}, seconds spent); runs in the parse processes'''
+    started = time.time()
+    parsed = {}
+    for page, html in pages.items():
+        try:
+            parsed[page] = None if html is None else parse_quote_summary(html, PAGES[page])
+        except Exception as e:
+            parsed[page] = None
+    return parsed, time.time() - started
+
+
+class RateLimiter:
+    '''Spaces the wait() calls of any number of threads at least
+       1/requests_per_second apart; a falsy rate disables it'''
+
+    def __init__(self, requests_per_second):
+        self.requests_per_second = requests_per_second
+        self._lock = threading.Lock()
+        self._next_request = 0
+
+    def wait(self):
+        if not self.requests_per_second:
+            return
+        with self._lock:
+            now = time.time()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + 1.0/self.requests_per_second
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ScanPipeline:
+    '''get_cash_flow_for_all's per-ticker work as four stages joined by bounded
+       queues, so that downloads, parsing and computation overlap:
+
+       fetch   - fetch_workers threads download the quote sub-pages (PAGES) not
+                 served from the fundamentals cache, at most requests_per_second
+                 pages per second together
+       parse   - parse_processes processes extract the QuoteSummaryStore of the
+                 pages (0 parses in a thread of this process)
+       compute - this thread hands the parsed pages to get_cash_flow_pg through
+                 StockInfo.prefetched, which runs collect_statements as before
+       write   - a thread records fetched tickers with the refresh scheduler (it
+                 looks up their next earnings date) and appends every ticker's
+                 outcome to <output_directory>/<run>_scan_log.csv as it finishes;
+                 the collected statements themselves go to the warehouse from
+                 collect_statements, the output tables are written after the run
+
+       Each queue holds at most queue_size tickers; a full queue blocks the stage
+       feeding it, so a slow stage throttles the ones before it instead of
+       piling up pages in memory. Tickers reach compute in scan order. When a
+       stage fails, the other stages are stopped and run() raises its error.
+       The parse processes are spawned, not forked, since the fetch threads are
+       running by then.
+
+       self.rate_limiter is shared with the other Yahoo page fetches of the
+       stock_info, e.g. the earnings calendar.
+    '''
+
+    def __init__(self, stock_info, fetch_workers = 4, parse_processes = 2, queue_size = 32,
+                 requests_per_second = 3):
+        self.stock_info = stock_info
+        self.fetch_workers = fetch_workers
+        self.parse_processes = parse_processes
+        self.queue_size = queue_size
+        self.rate_limiter = RateLimiter(requests_per_second)
+        # set when a stage failed, the other stages give up then
+        self._stop = threading.Event()
+        # first error of the fetch, parse or write stage, raised by run()
+        self._error = None
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, stage_queue, item):
+        '''Blocks until item is queued (True) or the run is stopped (False)'''
+        while not self._stop.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fetch(self, ticker):
+        '''(ticker, {page: html or None}) for the pages not cached, plus the set of
+           cached pages'''
+        pages = {}
+        cached = set()
+        for page in PAGES:
+            if self.stock_info._cached_fundamentals_json(ticker, page) is not None:
+                cached.add(page)
+                continue
+            with self.stock_info.metrics.timer("throttle_wait"):
+                self.rate_limiter.wait()
+            try:
+                with self.stock_info.metrics.timer("fetch", ticker):
+                    pages[page] = self.stock_info._http_get(self.stock_info._fundamentals_url(ticker, page),
+                                                            headers={'User-Agent': 'Custom'}).text
+            except Exception as e:
+                print(f"scan pipeline: fetching {page} of {ticker} FAILED: {e}")
+                pages[page] = None
+        return ticker, pages, cached
+
+    def _fetch_stage(self, tickers, parse_queue):
+        # numbered, the parse stage restores the scan order
+        ticker_queue = queue.Queue()
+        for index, ticker in enumerate(tickers):
+            ticker_queue.put((index, ticker))
+
+        def work():
+            try:
+                while not self.stock_info.stop_threads and not self._stop.is_set():
+                    try:
+                        index, ticker = ticker_queue.get_nowait()
+                    except queue.Empty:
+                        return
+                    if not self._put(parse_queue, (index,) + self._fetch(ticker)):
+                        return
+            except BaseException as e:
+                self._fail(e)
+
+        workers = [threading.Thread(target=work, daemon=True) for i in range(self.fetch_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self._put(parse_queue, _DONE)
+
+    def _parse_stage(self, parse_queue, compute_queue, pool):
+        limit = 2*max(self.parse_processes, 1)
+        pending = {}
+        next_index = 0
+
+        def hand_over(index):
+            ticker, parsed, cached = pending.pop(index)
+            if isinstance(parsed, Future):
+                parsed = parsed.result()
+            parsed, seconds = parsed
+            self.stock_info.metrics.record_stage("parse", seconds, ticker)
+            self._put(compute_queue, (ticker, parsed, cached))
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = parse_queue.get(timeout=0.05)
+                except queue.Empty:
+                    item = None
+                if item is _DONE:
+                    break
+                if item is not None:
+                    index, ticker, pages, cached = item
+                    parsed = pool.submit(_parse_pages, pages) if pool is not None else _parse_pages(pages)
+                    pending[index] = (ticker, parsed, cached)
+
+                # in scan order, as soon as parsed; waits for the next one once `limit` pile up
+                while next_index in pending and (len(pending) > limit
+                                                 or not isinstance(pending[next_index][1], Future)
+                                                 or pending[next_index][1].done()):
+                    hand_over(next_index)
+                    next_index += 1
+
+            # tickers missing in the sequence were never fetched (stop_threads)
+            for index in sorted(pending):
+                if self._stop.is_set():
+                    break
+                hand_over(index)
+        except BaseException as e:
+            # e.g. BrokenProcessPool from a dead parse worker
+            self._fail(e)
+        finally:
+            self._put(compute_queue, _DONE)
+
+    def _write_stage(self, write_queue, log_path):
+        scheduler = self.stock_info.scheduler
+        refresh_tickers = self.stock_info.refresh_tickers
+        with open(log_path, "w") as log:
+            log.write("ticker,pages_fetched,collected,seconds\n")
+            while True:
+                try:
+                    item = write_queue.get(timeout=0.1)
+                except queue.Empty:
+                    # a stopped run sends no _DONE, what was queued is written
+                    if self._stop.is_set():
+                        return
+                    continue
+                if item is _DONE:
+                    return
+                ticker, fetched, collected, seconds = item
+                try:
+                    if fetched and refresh_tickers is not None and ticker in refresh_tickers:
+                        scheduler.mark_fetched(ticker)
+                except BaseException as e:
+                    self._fail(e)
+                    return
+                log.write(f"{ticker},{int(fetched)},{int(collected)},{seconds:.3f}\n")
+                log.flush()
+
+    def run(self, tickers, run_string = ""):
+        '''Scans the tickers into the stock_info accumulators, like calling
+           get_cash_flow_pg for each of them'''
+        stock_info = self.stock_info
+        parse_queue = queue.Queue(self.queue_size)
+        compute_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+
+        os.makedirs(stock_info.output_directory, exist_ok=True)
+        log_path = os.path.join(stock_info.output_directory, f"{run_string}_scan_log.csv")
+        self._stop.clear()
+        self._error = None
+        pool = None
+        if self.parse_processes > 0:
+            pool = ProcessPoolExecutor(self.parse_processes, mp_context=multiprocessing.get_context("spawn"))
+        stages = [threading.Thread(target=self._fetch_stage, args=(list(tickers), parse_queue), daemon=True),
+                  threading.Thread(target=self._parse_stage, args=(parse_queue, compute_queue, pool), daemon=True),
+                  threading.Thread(target=self._write_stage, args=(write_queue, log_path), daemon=True)]
+        for stage in stages:
+            stage.start()
+
+        started = time.time()
+        count = 0
+        try:
+            while True:
+                try:
+                    item = compute_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    continue
+                if item is _DONE:
+                    break
+                ticker, parsed, cached = item
+                ticker_started = time.time()
+                for page, json_info in parsed.items():
+                    stock_info.prefetched[f"{page}_{ticker}"] = json_info
+                collected_before = len(stock_info.required_growth_for_all)
+                stock_info.get_cash_flow_pg(ticker, mark_fetched=False)
+                for page in parsed:
+                    stock_info.prefetched.pop(f"{page}_{ticker}", None)
+
+                fetched = all(page in cached or parsed.get(page) is not None for page in ("cash-flow", "financials"))
+                collected = len(stock_info.required_growth_for_all) > collected_before
+                if not self._put(write_queue, (ticker, fetched, collected, time.time() - ticker_started)):
+                    break
+                count += 1
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            self._put(write_queue, _DONE)
+            for stage in stages:
+                stage.join()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        elapsed = time.time() - started
+        if self._error is not None:
+            print(f"scan pipeline: FAILED after {count} tickers in {elapsed:.1f} s: {self._error!r}")
+            raise self._error
+        print(f"scan pipeline: {count} tickers in {elapsed:.1f} s, log in {log_path}")
@@ -0,0 +1,140 @@
+import re
+
+from lazy_imports import lazy_import
+from prescreen import OPERATORS
+
+pd = lazy_import("pandas")
+
+# canonical field -> (statement, field) pairs in the warehouse, first non-missing wins;
+# Yahoo's own names come first, the yfinance fallback names of get_cash_flow_pg second
+CANONICAL_FIELDS = {
+    "operating_cash_flow": [("cash_flow", "totalCashFromOperatingActivities"),
+                            ("cash_flow", "Total Cash From Operating Activities")],
+    "capex": [("cash_flow", "capitalExpenditures"), ("cash_flow", "Capital Expenditures")],
+    "net_income": [("cash_flow", "netIncome"), ("cash_flow", "Net Income")],
+    "revenue": [("income_statement", "totalRevenue"), ("income_statement", "Total Revenue")],
+}
+
+# latest value per ticker rather than per period, repeated on every period row
+SNAPSHOT_FIELDS = {"wacc": ("valuation", "wacc")}
+
+# the checks collect_statements applies while scanning
+DEFAULT_RULES = ["year >= 2010 over 4y",
+                 "fcf > 0 over 4y",
+                 "fcf monotonic over 4y"]
+
+_NUMBER = r"(-?\d+(?:\.\d+)?%?)"
+_OVER = r"(?:\s+over\s+(\d+)y)?"
+_COMPARISON = re.compile(r"^(\w+)\s*(>=|<=|==|!=|>|<)\s*" + _NUMBER + _OVER + "$")
+_BETWEEN = re.compile(r"^(\w+)\s+between\s+" + _NUMBER + r"\s+and\s+" + _NUMBER + _OVER + "$")
+_MONOTONIC = re.compile(r"^(\w+)\s+monotonic(?:\s+(increasing|decreasing))?" + _OVER + "$")
+
+
+def _number(text):
+    if text.endswith("%"):
+        return float(text[:-1])/100
+    return float(text)
+
+
+def load_fundamentals(warehouse, tickers = None):
+    '''Reads the canonical fields of all (or the given) tickers from the
+       warehouse in one query each into a frame indexed by (ticker, period_end),
+       with a column per canonical field plus the derived "fcf" (operating cash
+       flow + capital expenditures) and "year"'''
+    columns = {}
+    for name, sources in CANONICAL_FIELDS.items():
+        column = None
+        for statement, field in sources:
+            values = warehouse.history(statement, field, tickers).set_index(["ticker", "period_end"])["value"]
+            column = values if column is None else column.combine_first(values)
+        columns[name] = column
+    panel = pd.DataFrame(columns).sort_index()
+    panel.index.names = ["ticker", "period_end"]
+
+    panel["fcf"] = panel["operating_cash_flow"] + panel["capex"]
+    panel["year"] = panel.index.get_level_values("period_end").str[:4].astype(int)
+    ticker_level = panel.index.get_level_values("ticker")
+    for name, (statement, field) in SNAPSHOT_FIELDS.items():
+        panel[name] = warehouse.cross_section(statement, field).reindex(ticker_level).values
+    return panel
+
+
+class Screen:
+    '''Screen over stored fundamentals, built from rule expressions on the
+       fields of load_fundamentals:
+
+           "<field> <op> <number>"            e.g. "fcf > 0", op one of > >= < <= == !=
+           "<field> between <low> and <high>" e.g. "wacc between 5% and 12%", inclusive
+           "<field> monotonic [increasing|decreasing] over <n>y"  non-strict, increasing by default
+
+       Comparisons and between apply to the latest value of a ticker, or to every
+       one of its last n periods when followed by "over <n>y", which needs n
+       periods to be stored. A missing value fails its rule. Numbers may be given in percent.
+
+       Rules are compiled once; run() evaluates each as a few column operations
+       over the whole universe, so screens can be changed and re-run without
+       scraping again.
+    '''
+
+    def __init__(self, rules = None):
+        self.rules = DEFAULT_RULES if rules is None else list(rules)
+        self._compiled = [self._compile(rule) for rule in self.rules]
+        self.results = pd.DataFrame()
+
+    def _compile(self, rule):
+        rule = rule.strip()
+        match = _COMPARISON.match(rule)
+        if match:
+            field, op, value, years = match.groups()
+            value = _number(value)
+            return field, years, lambda column: OPERATORS[op](column, value)
+
+        match = _BETWEEN.match(rule)
+        if match:
+            field, low, high, years = match.groups()
+            low, high = _number(low), _number(high)
+            return field, years, lambda column: column.between(low, high)
+
+        match = _MONOTONIC.match(rule)
+        if match:
+            field, direction, years = match.groups()
+            sign = -1 if direction == "decreasing" else 1
+            def monotonic(column):
+                change = column.groupby(level="ticker").diff()*sign
+                first = column.groupby(level="ticker").cumcount() == 0
+                return first | (change >= 0)
+            # monotonic always looks at a window, all stored periods if none is given
+            return field, years or 0, monotonic
+
+        raise AssertionError(f"cannot parse screening rule: {rule}")
+
+    def _evaluate(self, panel, field, years, check):
+        if field not in panel.columns:
+            raise AssertionError(f"unknown field {field}, must be one of {list(panel.columns)}")
+        # the window is taken before missing values are looked at, so a missing
+        # latest value fails the rule instead of an older period standing in for it
+        column = panel[field]
+        grouped = column.groupby(level="ticker")
+        if years is None:
+            window = grouped.tail(1)
+        elif int(years) == 0:
+            window = column
+        else:
+            window = grouped.tail(int(years))
+        passed = (check(window) & window.notna()).groupby(level="ticker").all()
+        if years is not None and int(years) > 0:
+            # "over <n>y" needs n stored periods
+            passed &= window.groupby(level="ticker").count() >= int(years)
+        return passed.reindex(panel.index.unique("ticker"), fill_value=False)
+
+    def run(self, panel):
+        '''Returns the tickers of the panel passing all rules; self.results keeps
+           the outcome of every rule per ticker
+
+           @param: panel - from load_fundamentals
+        '''
+        results = {rule: self._evaluate(panel, field, years, check)
+                   for rule, (field, years, check) in zip(self.rules, self._compiled)}
+        self.results = pd.DataFrame(results, index=panel.index.unique("ticker"))
+        self.results["passed"] = self.results.all(axis=1)
+        return self.results.index[self.results["passed"]].tolist()
@@ -1,29 +1,49 @@
+import os
 import time
 
-import numpy as np
-import requests
-import pandas as pd
-import ftplib
-import io
 import re
 import json
 import datetime
-import yfinance as yf
-import click
 import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 from pg_stocks import pg_stocks
 import stocks
-
-try:
-    from requests_html import HTMLSession
-except Exception:
-    print("""Warning - Certain functionality 
+from lazy_imports import lazy_import
+from valuation import ValuationGraph
+from wacc_engine import WaccEngine
+from marketwatch import read_income_statement_rows
+from cache import FileCache
+from ticker_universe import TickerUniverse
+from prescreen import PreScreen
+from refresh_scheduler import RefreshScheduler
+from warehouse import Warehouse
+from quote_summary import parse_quote_summary
+from scan_pipeline import ScanPipeline
+from metrics import Metrics, timed
+from profiling import Profiler, parse_sample, sample_tickers
+from screening import Screen, load_fundamentals
+from output import OutputWriter, ticker_table_dtypes
+
+# heavy dependencies are imported on first use, see lazy_imports;
+# yfinance, requests_html and click are imported by the functions needing them
+pd = lazy_import("pandas")
+requests = lazy_import("requests")
+
+
+def _html_session():
+    try:
+        from requests_html import HTMLSession
+    except Exception:
+        print("""Warning - Certain functionality 
              requires requests_html, which is not installed.
 
              Install using: 
              pip install requests_html
 
              After installation, you may have to restart your Python session.""")
+        raise
+    return HTMLSession()
 
 class dividend_frequency:
     no_dividend = -1
@@ -63,8 +83,34 @@ class dividend_card:
         return arr
 
 class StockInfo:
-    def __init__(self):
-        self.base_url = "https://query1.finance.yahoo.com/v8/finance/chart/"
+    def __init__(self, risk_free_rate = None, risk_free_rate_ttl = 3600, cache_dir = None):
+        '''@param: risk_free_rate = None - 10 year bond rate in percent; fetched lazily
+                                           from Yahoo when not given
+           @param: risk_free_rate_ttl = 3600 - seconds a fetched rate stays valid
+           @param: cache_dir = None - directory of all file caches, cache.DEFAULT_CACHE_DIR if None
+        '''
+        self.cache_dir = cache_dir
+        # hosts of every Yahoo and MarketWatch request, to point StockInfo at a stand-in server
+        self.yahoo_url = "https://finance.yahoo.com"
+        self.query_url = "https://query1.finance.yahoo.com"
+        self.marketwatch_url = "https://www.marketwatch.com"
+        self.base_url = self.query_url + "/v8/finance/chart/"
+
+        # stage timers, per-host request counters and cache hit rates; get_cash_flow_for_all
+        # exports them into the output directory every metrics_interval seconds
+        self.metrics = Metrics()
+        self.metrics_interval = 30
+        # profiling mode of get_cash_flow_for_all: a number of evenly spaced tickers or a list of
+        # tickers to scan, one after the other, under cProfile/tracemalloc per stage (see profiling);
+        # the reports go into <profile_directory or output_directory>/<run>_profile
+        self.profile_sample = None
+        self.profile_directory = None
+        self.profile_top = 20
+        self.profiler = None
+        # retries of a request after a connection error, 429 or 5xx answer, see _http_get
+        self.http_retries = 2
+        # seconds a request may wait for the server before it counts as a connection error
+        self.http_timeout = 30
 
         self.cash_flow_columns = None
         self.cash_flow_statements = []
@@ -81,9 +127,107 @@ class StockInfo:
         self.stop_threads = False
         self.starting_from_ticker = ""
 
-        self.risk_free_rate = self.get_risk_free_rate()
+        # cached symbol directories and index lists to build scan lists from
+        self.universe = TickerUniverse(self, cache_dir=cache_dir)
+        # drops obvious non-candidates from one batched quote call before get_cash_flow_for_all
+        # scrapes them; configure with PreScreen(self, filters) or disable with None
+        self.prescreen = PreScreen(self)
+
+        # statement pages of scanned tickers; get_cash_flow_for_all re-scrapes only the tickers
+        # the scheduler finds due (refresh_tickers) and serves the others from this cache
+        self.fundamentals = FileCache("fundamentals", cache_dir=cache_dir)
+        self.metrics.register_cache("fundamentals", self.fundamentals)
+        self.scheduler = RefreshScheduler(self, cache_dir=cache_dir)
+        self.refresh_tickers = None
+        self.use_refresh_scheduler = True
+        # get_cash_flow_for_all fetches, parses and computes in overlapping stages;
+        # None scans one ticker after the other
+        self.scan_pipeline = ScanPipeline(self)
+        # pages the scan pipeline parsed, consumed by _fundamentals_json
+        self.prefetched = {}
+        # every statement collect_statements and get_financials see, in long form; opened on first use
+        self._warehouse = None
+        # earnings calendar days, see get_earnings_for_date
+        self.earnings_calendar = FileCache("earnings_calendar", cache_dir=cache_dir)
+        self.metrics.register_cache("earnings_calendar", self.earnings_calendar)
+
+        # WACC of collected tickers is computed in one batch at the end of the scan (see fill_required_growth)
+        # instead of inside collect_statements
+        self.batch_wacc = True
+        self.wacc_fallbacks = None
+        # per-rule outcome of the last screen_fundamentals call
+        self.screen_results = None
+
+        # where and how run results are written, see output.OutputWriter
+        self.output_directory = "C:/MyProjects/Indicators/DCF_screner/"
+        self.dividend_output_directory = "C:/Users/USER/Downloads/yahoo_fin_news/"
+        self.output_format = "csv"
+        self.output_compression = "zstd"
+
         self.market_perpetual_growth_rate = 0.025
 
+        # latest inputs of every scanned ticker; lets valuations be refreshed from prices alone
+        self.valuation = ValuationGraph(self.market_perpetual_growth_rate)
+
+        # the risk free rate is only scraped on first use, see the risk_free_rate property
+        self.risk_free_rate_ttl = risk_free_rate_ttl
+        self._risk_free_rate = None
+        self._risk_free_rate_at = 0
+        self._risk_free_rate_pinned = False
+        self._market_cache = None
+        if risk_free_rate is not None:
+            self.risk_free_rate = risk_free_rate
+
+    @property
+    def risk_free_rate(self):
+        '''10 year bond rate in percent. Resolved on first use and kept for
+           risk_free_rate_ttl seconds, both in this object and in a file cache
+           shared with other StockInfo instances and processes. An assigned
+           (injected) rate is used as is and never refreshed.'''
+
+        if self._risk_free_rate_pinned:
+            return self._risk_free_rate
+
+        if self._risk_free_rate is None or time.time() - self._risk_free_rate_at > self.risk_free_rate_ttl:
+            rate = self._get_market_cache().get("risk_free_rate")
+            if rate is None:
+                rate = float(self.get_risk_free_rate())
+                self._get_market_cache().set("risk_free_rate", rate)
+            self._set_risk_free_rate(rate)
+        return self._risk_free_rate
+
+    @risk_free_rate.setter
+    def risk_free_rate(self, rate):
+        self._set_risk_free_rate(rate)
+        self._risk_free_rate_pinned = True
+
+    def _get_market_cache(self):
+        if self._market_cache is None:
+            self._market_cache = FileCache("market", ttl=self.risk_free_rate_ttl, cache_dir=self.cache_dir)
+            self.metrics.register_cache("market", self._market_cache)
+        return self._market_cache
+
+    @property
+    def warehouse(self):
+        if self._warehouse is None:
+            self._warehouse = Warehouse()
+        return self._warehouse
+
+    def point_at(self, url):
+        '''Sends every Yahoo and MarketWatch request to url (e.g. a local
+           stub_server.StubServer) instead of the real hosts'''
+        url = url.rstrip("/")
+        self.yahoo_url = url
+        self.query_url = url
+        self.marketwatch_url = url
+        self.base_url = url + "/v8/finance/chart/"
+
+    def _set_risk_free_rate(self, rate):
+        self._risk_free_rate_at = time.time()
+        if rate != self._risk_free_rate:
+            self._risk_free_rate = rate
+            self.valuation.set_input("risk_free_rate", rate)
+
     def build_url(self, ticker, start_date = None, end_date = None, interval = "1d"):
 
         if end_date is None:
@@ -141,8 +285,8 @@ class StockInfo:
             raise AssertionError("interval must be of of '1d', '1wk', '1mo', or '1m'")
 
         # build and connect to URL
-        site, params = build_url(ticker, start_date, end_date, interval)
-        resp = requests.get(site, params = params)
+        site, params = self.build_url(ticker, start_date, end_date, interval)
+        resp = self._http_get(site, params = params)
 
         if not resp.ok:
             raise AssertionError(resp.json())
@@ -192,57 +336,22 @@ class StockInfo:
 
     def tickers_nasdaq(self, include_company_data = False):
 
-        '''Downloads list of tickers currently listed in the NASDAQ'''
-
-        ftp = ftplib.FTP("ftp.nasdaqtrader.com")
-        ftp.login()
-        ftp.cwd("SymbolDirectory")
-
-        r = io.BytesIO()
-        ftp.retrbinary('RETR nasdaqlisted.txt', r.write)
+        '''List of tickers currently listed in the NASDAQ, from the symbol
+           directory cached by self.universe (see TickerUniverse)'''
 
+        data = self.universe.symbol_directory("nasdaq")
         if include_company_data:
-            r.seek(0)
-            data = pd.read_csv(r, sep = "|")
             return data
-
-        info = r.getvalue().decode()
-        splits = info.split("|")
-
-
-        tickers = [x for x in splits if "\r\n" in x]
-        tickers = [x.split("\r\n")[1] for x in tickers if "NASDAQ" not in x != "\r\n"]
-        tickers = [ticker for ticker in tickers if "File" not in ticker]
-
-        ftp.close()
-
-        return tickers
+        return data["Symbol"].tolist()
 
     def tickers_other(self, include_company_data = False):
-        '''Downloads list of tickers currently listed in the "otherlisted.txt"
-           file on "ftp.nasdaqtrader.com" '''
-        ftp = ftplib.FTP("ftp.nasdaqtrader.com")
-        ftp.login()
-        ftp.cwd("SymbolDirectory")
-
-        r = io.BytesIO()
-        ftp.retrbinary('RETR otherlisted.txt', r.write)
+        '''List of tickers currently listed in the "otherlisted.txt"
+           file on "ftp.nasdaqtrader.com", cached by self.universe '''
 
+        data = self.universe.symbol_directory("other")
         if include_company_data:
-            r.seek(0)
-            data = pd.read_csv(r, sep = "|")
             return data
-
-        info = r.getvalue().decode()
-        splits = info.split("|")
-
-        tickers = [x for x in splits if "\r\n" in x]
-        tickers = [x.split("\r\n")[1] for x in tickers]
-        tickers = [ticker for ticker in tickers if "File" not in ticker]
-
-        ftp.close()
-
-        return tickers
+        return data["ACT Symbol"].tolist()
 
 
     def tickers_dow(self, include_company_data = False):
@@ -272,7 +381,7 @@ class StockInfo:
 
     def tickers_nifty50(self, include_company_data = False):
         '''Downloads list of currently traded tickers on the NIFTY 50, India'''
-        site = "https://finance.yahoo.com/quote/%5ENSEI/components?p=%5ENSEI"
+        site = self.yahoo_url + "/quote/%5ENSEI/components?p=%5ENSEI"
         table = pd.read_html(site)[0]
 
         if include_company_data:
@@ -313,7 +422,7 @@ class StockInfo:
            @param: dict_result = True
         '''
 
-        site = "https://finance.yahoo.com/quote/" + ticker + "?p=" + ticker
+        site = self.yahoo_url + "/quote/" + ticker + "?p=" + ticker
         tables = pd.read_html(site)
         data = tables[0].append(tables[1])
         data.columns = ["attribute" , "value"]
@@ -339,7 +448,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        stats_site = "https://finance.yahoo.com/quote/" + ticker + \
+        stats_site = self.yahoo_url + "/quote/" + ticker + \
                      "/key-statistics?p=" + ticker
 
         tables = pd.read_html(stats_site)
@@ -360,7 +469,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        stats_site = "https://finance.yahoo.com/quote/" + ticker + \
+        stats_site = self.yahoo_url + "/quote/" + ticker + \
                      "/key-statistics?p=" + ticker
 
         tables = pd.read_html(stats_site)
@@ -370,24 +479,83 @@ class StockInfo:
         return table
 
 
+    def _http_get(self, url, **kwargs):
+        '''requests.get for every Yahoo and MarketWatch request: timed, sized and
+           counted per host in self.metrics, and retried up to self.http_retries
+           times on connection errors and 5xx answers (after 1, 2, 4... seconds)
+           and on 429 answers (after their Retry-After, at most a minute); waits
+           at most self.http_timeout seconds for the server unless a timeout is given'''
+        host = urlparse(url).hostname
+        kwargs.setdefault("timeout", self.http_timeout)
+        for attempt in range(self.http_retries + 1):
+            delay = 2**attempt
+            started = time.time()
+            try:
+                resp = requests.get(url, **kwargs)
+            except requests.exceptions.RequestException:
+                self.metrics.record_request(host, time.time() - started)
+                if attempt == self.http_retries:
+                    raise
+            else:
+                # a streamed body is not read here, its size is what the server announced
+                if kwargs.get("stream"):
+                    size = int(resp.headers.get("Content-Length") or 0)
+                else:
+                    size = len(resp.content)
+                self.metrics.record_request(host, time.time() - started, size, resp.status_code)
+                if (resp.status_code != 429 and resp.status_code < 500) or attempt == self.http_retries:
+                    return resp
+                if resp.status_code == 429:
+                    self.metrics.count("throttled")
+                    retry_after = resp.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = min(int(retry_after), 60)
+                else:
+                    self.metrics.count("server_errors")
+                resp.close()
+
+            self.metrics.count("retries")
+            with self.metrics.timer("retry_wait"):
+                time.sleep(delay)
+
+    @timed("_parse_json")
     def _parse_json(self, url):
-        html = requests.get(url=url, headers={'User-Agent': 'Custom'}).text
-
-        json_str = html.split('root.App.main =')[1].split(
-            '(this)')[0].split(';\n}')[0].strip()
-        data = json.loads(json_str)[
-            'context']['dispatcher']['stores']['QuoteSummaryStore']
-
-        # return data
-        new_data = json.dumps(data).replace('{}', 'null')
-        new_data = re.sub(r'\{[\'|\"]raw[\'|\"]:(.*?),(.*?)\}', r'\1', new_data)
-
-        json_info = json.loads(new_data)
-
+        html = self._http_get(url, headers={'User-Agent': 'Custom'}).text
+        return parse_quote_summary(html)
+
+    def _fundamentals_url(self, ticker, page):
+        return self.yahoo_url + "/quote/" + ticker + "/" + page + "?p=" + ticker
+
+    def _cached_fundamentals_json(self, ticker, page):
+        '''The cached page of a ticker when a scheduled scan found it not due for
+           a refresh, None otherwise'''
+        if self.refresh_tickers is not None and ticker not in self.refresh_tickers:
+            return self.fundamentals.get(f"{page}_{ticker}")
+        return None
+
+    def _fundamentals_json(self, ticker, page, keys):
+        '''The keys entries of a quote sub-page's QuoteSummaryStore (e.g. page
+           "cash-flow"). Taken from self.fundamentals when a scheduled scan
+           found the ticker not due for a refresh, scraped and cached otherwise.
+           A page the scan pipeline already parsed is taken from self.prefetched
+           (None there means its fetch failed).'''
+
+        cache_key = f"{page}_{ticker}"
+        if cache_key in self.prefetched:
+            json_info = self.prefetched.pop(cache_key)
+            if json_info is None:
+                raise AssertionError(f"{page} page of {ticker} could not be fetched")
+        else:
+            json_info = self._cached_fundamentals_json(ticker, page)
+            if json_info is not None:
+                return json_info
+            json_info = self._parse_json(self._fundamentals_url(ticker, page))
+            json_info = {key: json_info[key] for key in keys if key in json_info}
+        self.fundamentals.set(cache_key, json_info)
         return json_info
 
     def _parse_json1(self, url):
-        html = requests.get(url=url, headers={'User-Agent': 'Custom'}).text
+        html = self._http_get(url, headers={'User-Agent': 'Custom'}).text
 
         json_str = html.split('root.App.main =')[1].split(
             '(this)')[0].split(';\n}')[0].strip()
@@ -417,6 +585,7 @@ class StockInfo:
 
 
 
+    @timed("collect_statements")
     def collect_statements(self, ticker, data_frame_cash_flow, data_frame_income_statement):
 
         if data_frame_cash_flow.empty or len(data_frame_cash_flow.columns) == 0 or data_frame_cash_flow.size == 0:
@@ -430,11 +599,20 @@ class StockInfo:
         data_frame_income_statement.set_index("endDate", inplace=True)
         data_frame_income_statement.index = pd.to_datetime(data_frame_income_statement.index, unit="s")
 
+        self.warehouse.write_statement(ticker, "cash_flow", data_frame_cash_flow)
+        self.warehouse.write_statement(ticker, "income_statement", data_frame_income_statement)
+        # valuation rows are only kept for tickers passing the checks below
+        self.warehouse.delete(ticker, "valuation")
+        valuation_rows = []
+
         the_total_row = [ticker]
         the_total_row_revenue = [ticker]
         the_total_row_income = [ticker]
         the_total_row_growth = [ticker]
-        required_growth = self.calc_wacc(ticker)
+        if self.batch_wacc:
+            required_growth = None  # filled in by fill_required_growth
+        else:
+            required_growth = self.calc_wacc(ticker)
         the_total_row_growth = the_total_row_growth + [required_growth]
 
         if(self.cash_flow_columns is None):
@@ -527,6 +705,7 @@ class StockInfo:
                     print("collect_statements: {} skipped due to inconsistent cash flow growth".format(ticker))
                     return
             prev_cash_flow = free_csh_flow
+            valuation_rows.append((ticker, "valuation", "free_cash_flow", statement_date, float(free_csh_flow)))
 
             the_row = [ticker] + [statement_year] + [free_csh_flow] + the_row
             self.cash_flow_statements.append(the_row)
@@ -542,11 +721,7 @@ class StockInfo:
         #################################################
         #add revenue estimates from analysts
         try:
-            cash_flow_site = "https://finance.yahoo.com/quote/" + \
-                             ticker + "/analysis?p=" + ticker
-
-
-            json_info = self._parse_json(cash_flow_site)
+            json_info = self._fundamentals_json(ticker, "analysis", ["earningsTrend"])
             data_frame = pd.DataFrame(json_info["earningsTrend"]["trend"])
             del data_frame["maxAge"]
 
@@ -562,6 +737,8 @@ class StockInfo:
                     print("collect_statements for {}; cash flow statement {}".format(ticker, statement_year))
                     average_revenue_estimate = statement["revenueEstimate"]["avg"]
                     the_total_row_revenue = the_total_row_revenue + [average_revenue_estimate]
+                    valuation_rows.append((ticker, "estimates", "revenueEstimate", statement_date,
+                                           float(average_revenue_estimate)))
         except Exception as e:
             pass
 
@@ -569,6 +746,13 @@ class StockInfo:
         self.revenue_statements_for_all.append(the_total_row_revenue)
         self.net_income_statements_for_all.append(the_total_row_income)
         self.required_growth_for_all.append(the_total_row_growth)
+        if required_growth is not None:
+            valuation_rows.append((ticker, "valuation", "wacc", datetime.date.today().isoformat(), required_growth))
+        self.warehouse.write_values(valuation_rows)
+        self.valuation.update_input("statements", pd.DataFrame({"fcf": [the_total_row[-1]],
+                                                                "revenue": [the_total_row_revenue[-1]],
+                                                                "net_income": [the_total_row_income[-1]]},
+                                                               index=[ticker]))
         print("collect_statements done for {}".format(ticker))
 
     def get_income_statement(self, ticker, yearly = True):
@@ -577,7 +761,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        income_site = "https://finance.yahoo.com/quote/" + ticker + \
+        income_site = self.yahoo_url + "/quote/" + ticker + \
                       "/financials?p=" + ticker
 
         json_info = self._parse_json(income_site)
@@ -598,7 +782,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        balance_sheet_site = "https://finance.yahoo.com/quote/" + ticker + \
+        balance_sheet_site = self.yahoo_url + "/quote/" + ticker + \
                              "/balance-sheet?p=" + ticker
 
 
@@ -618,7 +802,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        cash_flow_site = "https://finance.yahoo.com/quote/" + \
+        cash_flow_site = self.yahoo_url + "/quote/" + \
                          ticker + "/cash-flow?p=" + ticker
 
         json_info = self._parse_json(cash_flow_site)
@@ -640,7 +824,7 @@ class StockInfo:
         data_frame = None
         i = 1
         try:
-            cash_flow_site = "https://finance.yahoo.com/quote/" + \
+            cash_flow_site = self.yahoo_url + "/quote/" + \
                              ticker + "/analysis?p=" + ticker
 
 
@@ -661,19 +845,19 @@ class StockInfo:
         #self.collect_statements(ticker, data_frame)
         return
 
-    def get_cash_flow_pg(self, ticker, yearly=True):
+    @timed("get_cash_flow_pg")
+    def get_cash_flow_pg(self, ticker, yearly=True, mark_fetched=True):
         '''Scrapes the cash flow statement from Yahoo Finance for an input ticker
 
            @param: ticker
+           @param: mark_fetched = True - record a refreshed ticker with the scheduler;
+                                         the scan pipeline does it in its write stage
         '''
 
         data_frame = None
         i = 1
         try:
-            cash_flow_site = "https://finance.yahoo.com/quote/" + \
-                             ticker + "/cash-flow?p=" + ticker
-
-            json_info = self._parse_json(cash_flow_site)
+            json_info = self._fundamentals_json(ticker, "cash-flow", ["cashflowStatementHistory"])
             json_info_sel = json_info["cashflowStatementHistory"]["cashflowStatements"]
             data_frame = pd.DataFrame(json_info_sel)
             del data_frame["maxAge"]
@@ -683,6 +867,7 @@ class StockInfo:
         if(data_frame is None):
             time.sleep(1)
             try:
+                import yfinance as yf
                 yf_ticker = yf.Ticker(ticker)
                 cf = yf_ticker.cashflow
                 if not cf.empty:
@@ -701,9 +886,7 @@ class StockInfo:
         # endDate
         data_frame = None
         try:
-            income_site = "https://finance.yahoo.com/quote/" + ticker + \
-                          "/financials?p=" + ticker
-            json_info = self._parse_json(income_site)
+            json_info = self._fundamentals_json(ticker, "financials", ["incomeStatementHistory"])
             json_info_sel = json_info["incomeStatementHistory"]["incomeStatementHistory"]
             data_frame = pd.DataFrame(json_info_sel)
             del data_frame["maxAge"]
@@ -715,6 +898,9 @@ class StockInfo:
             return
         data_frame_income_statement = data_frame
 
+        if mark_fetched and self.refresh_tickers is not None and ticker in self.refresh_tickers:
+            self.scheduler.mark_fetched(ticker)
+
         self.collect_statements(ticker, data_frame_cash_flow, data_frame_income_statement)
         return self.cash_flow_statements
 
@@ -733,7 +919,7 @@ class StockInfo:
         if not yearly and not quarterly:
             raise AssertionError("yearly or quarterly must be True")
 
-        financials_site = "https://finance.yahoo.com/quote/" + ticker + \
+        financials_site = self.yahoo_url + "/quote/" + ticker + \
                           "/financials?p=" + ticker
 
         json_info = self._parse_json(financials_site)
@@ -767,6 +953,9 @@ class StockInfo:
             table = self._parse_table(temp)
             result["quarterly_cash_flow"] = table
 
+        for name, table in result.items():
+            self.warehouse.write_table(ticker, name.replace("yearly_", ""), table)
+
         return result
 
 
@@ -776,7 +965,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        holders_site = "https://finance.yahoo.com/quote/" + \
+        holders_site = self.yahoo_url + "/quote/" + \
                        ticker + "/holders?p=" + ticker
 
         tables = pd.read_html(holders_site , header = 0)
@@ -791,7 +980,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        analysts_site = "https://finance.yahoo.com/quote/" + ticker + \
+        analysts_site = self.yahoo_url + "/quote/" + ticker + \
                         "/analysts?p=" + ticker
 
         tables = pd.read_html(analysts_site , header = 0)
@@ -811,7 +1000,7 @@ class StockInfo:
 
 
     def _raw_get_daily_info(self, site):
-        session = HTMLSession()
+        session = _html_session()
         resp = session.get(site)
         tables = pd.read_html(resp.html.raw_html)
 
@@ -833,19 +1022,19 @@ class StockInfo:
 
 
     def get_day_most_active(self):
-        return self._raw_get_daily_info("https://finance.yahoo.com/most-active?offset=0&count=100")
+        return self._raw_get_daily_info(self.yahoo_url + "/most-active?offset=0&count=100")
 
     def get_day_gainers(self):
-        return self._raw_get_daily_info("https://finance.yahoo.com/gainers?offset=0&count=100")
+        return self._raw_get_daily_info(self.yahoo_url + "/gainers?offset=0&count=100")
 
     def get_day_losers(self):
-        return self._raw_get_daily_info("https://finance.yahoo.com/losers?offset=0&count=100")
+        return self._raw_get_daily_info(self.yahoo_url + "/losers?offset=0&count=100")
 
 
     def get_top_crypto(self):
         '''Gets the top 100 Cryptocurrencies by Market Cap'''
-        session = HTMLSession()
-        resp = session.get("https://finance.yahoo.com/cryptocurrencies?offset=0&count=100")
+        session = _html_session()
+        resp = session.get(self.yahoo_url + "/cryptocurrencies?offset=0&count=100")
 
         tables = pd.read_html(resp.html.raw_html)
 
@@ -880,7 +1069,7 @@ class StockInfo:
 
         # build and connect to URL
         site, params = self.build_url(ticker, start_date, end_date, "1d")
-        resp = requests.get(site, params = params)
+        resp = self._http_get(site, params = params)
 
 
         if not resp.ok:
@@ -931,7 +1120,7 @@ class StockInfo:
 
         # build and connect to URL
         site, params = build_url(ticker, start_date, end_date, "1d")
-        resp = requests.get(site, params = params)
+        resp = self._http_get(site, params = params)
 
 
         if not resp.ok:
@@ -974,7 +1163,7 @@ class StockInfo:
            @param: ticker
         '''
 
-        financials_site = "https://finance.yahoo.com/quote/" + ticker + \
+        financials_site = self.yahoo_url + "/quote/" + ticker + \
                           "/financials?p=" + ticker
 
         json_info = self._parse_json(financials_site)
@@ -989,7 +1178,7 @@ class StockInfo:
 
     ### Earnings functions
     def _parse_earnings_json(self, url):
-        resp = requests.get(url)
+        resp = self._http_get(url)
         content = resp.content.decode(encoding='utf-8', errors='strict')
 
         page_data = [row for row in content.split(
@@ -999,7 +1188,7 @@ class StockInfo:
         return json.loads(page_data)
 
     def get_next_earnings_date(self, ticker):
-        base_earnings_url = 'https://finance.yahoo.com/quote'
+        base_earnings_url = self.yahoo_url + '/quote'
         new_url = base_earnings_url + "/" + ticker
 
         parsed_result = self._parse_earnings_json(new_url)
@@ -1012,48 +1201,81 @@ class StockInfo:
            Returns the earnings calendar history of the input ticker with
            EPS actual vs. expected data.'''
 
-        url = 'https://finance.yahoo.com/calendar/earnings?symbol=' + ticker
+        url = self.yahoo_url + '/calendar/earnings?symbol=' + ticker
 
         result = self._parse_earnings_json(url)
         return result["context"]["dispatcher"]["stores"]["ScreenerResultsStore"]["results"]["rows"]
 
 
 
-    def get_earnings_for_date(self, date, offset = 0, count = 1):
+    def throttle(self):
+        '''Waits for the scan pipeline's rate limiter before a page request made
+           outside the pipeline, so that it is paced together with the scan's own
+           fetches; does not wait without a pipeline'''
+        if self.scan_pipeline is not None:
+            with self.metrics.timer("throttle_wait"):
+                self.scan_pipeline.rate_limiter.wait()
+
+    def _get_earnings_page(self, date, offset):
+        self.throttle()
+        base_earnings_url = self.yahoo_url + '/calendar/earnings'
+
+        dated_url = '{0}?day={1}&offset={2}&size={3}'.format(
+            base_earnings_url, date, offset, 100)
+
+        result = self._parse_earnings_json(dated_url)
+        stores = result['context']['dispatcher']['stores']
+        earnings_count = stores['ScreenerCriteriaStore']['meta']['total']
+        return earnings_count, stores['ScreenerResultsStore']['results']['rows']
+
+    def _get_cached_earnings_day(self, date):
+        key = "day_" + date
+        stored_at = self.earnings_calendar.stored_at(key)
+        if stored_at is None:
+            return None
+        # a day fetched after it was over is final; the current and coming days still change
+        final = datetime.date.fromtimestamp(stored_at) > datetime.date.fromisoformat(date)
+        return self.earnings_calendar.get(key, ttl = None if final else 6*3600)
+
+    def get_earnings_for_date(self, date, offset = 0, max_workers = 8):
         '''Inputs: @date
            Returns a dictionary of stock tickers with earnings expected on the
            input date.  The dictionary contains the expected EPS values for each
-           stock if available.'''
-
-        base_earnings_url = 'https://finance.yahoo.com/calendar/earnings'
+           stock if available.
 
-        if offset >= count:
-            return []
+           The first page gives the total count, the remaining pages of 100 are
+           then fetched concurrently. Whole days are cached, permanently once
+           the day is over.'''
 
         temp = pd.Timestamp(date)
         date = temp.strftime("%Y-%m-%d")
 
-        dated_url = '{0}?day={1}&offset={2}&size={3}'.format(
-            base_earnings_url, date, offset, 100)
+        if offset == 0:
+            cached = self._get_cached_earnings_day(date)
+            if cached is not None:
+                return cached
 
-        result = self._parse_earnings_json(dated_url)
-        stores = result['context']['dispatcher']['stores']
-        earnings_count = stores['ScreenerCriteriaStore']['meta']['total']
-        new_offset = offset + 100
-        more_earnings = self.get_earnings_for_date(date, new_offset, earnings_count)
-        current_earnings = stores['ScreenerResultsStore']['results']['rows']
-        total_earnings = current_earnings + more_earnings
+        earnings_count, total_earnings = self._get_earnings_page(date, offset)
+        offsets = range(offset + 100, earnings_count, 100)
+        if len(offsets) > 0:
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                for more_earnings in executor.map(lambda page_offset: self._get_earnings_page(date, page_offset)[1], offsets):
+                    total_earnings = total_earnings + more_earnings
+
+        if offset == 0:
+            self.earnings_calendar.set("day_" + date, total_earnings)
         return total_earnings
 
 
-    def get_earnings_in_date_range(self, start_date, end_date):
+    def get_earnings_in_date_range(self, start_date, end_date, max_workers = 8):
         '''Inputs: @start_date
                    @end_date
 
            Returns the stock tickers with expected EPS data for all dates in the
-           input range (inclusive of the start_date and end_date.'''
-
-        earnings_data = []
+           input range (inclusive of the start_date and end_date. The pages of
+           all days not cached yet are fetched on one pool of max_workers
+           threads: the first page of a day gives its count, its other pages are
+           queued then. Days that fail are reported and skipped.'''
 
         days_diff = pd.Timestamp(end_date) - pd.Timestamp(start_date)
         days_diff = days_diff.days
@@ -1063,20 +1285,44 @@ class StockInfo:
         dates = [current_date + datetime.timedelta(diff) for diff in range(days_diff + 1)]
         dates = [d.strftime("%Y-%m-%d") for d in dates]
 
-        i = 0
-        while i < len(dates):
-            try:
-                earnings_data += get_earnings_for_date(dates[i])
-            except Exception:
-                pass
-            i += 1
+        days = {}
+        for date in dates:
+            cached = self._get_cached_earnings_day(date)
+            if cached is not None:
+                days[date] = cached
+        missing = [date for date in dates if date not in days]
+
+        pages = {date: {} for date in missing}
+        failed = {}
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            futures = {executor.submit(self._get_earnings_page, date, 0): (date, 0) for date in missing}
+            while futures:
+                done, not_done = wait(futures, return_when = FIRST_COMPLETED)
+                for future in done:
+                    date, offset = futures.pop(future)
+                    try:
+                        earnings_count, rows = future.result()
+                    except Exception as e:
+                        failed.setdefault(date, e)
+                        continue
+                    pages[date][offset] = rows
+                    if offset == 0:
+                        for page_offset in range(100, earnings_count, 100):
+                            futures[executor.submit(self._get_earnings_page, date, page_offset)] = (date, page_offset)
+
+        for date in missing:
+            if date in failed:
+                print(f"FAILED to get earnings for {date}: {failed[date]}")
+                continue
+            days[date] = [row for offset in sorted(pages[date]) for row in pages[date][offset]]
+            self.earnings_calendar.set("day_" + date, days[date])
 
-        return earnings_data
+        return [row for date in dates if date in days for row in days[date]]
 
 
     def get_currencies(self):
         '''Returns the currencies table from Yahoo Finance'''
-        tables = pd.read_html("https://finance.yahoo.com/currencies")
+        tables = pd.read_html(self.yahoo_url + "/currencies")
         result = tables[0]
         return result
 
@@ -1084,7 +1330,7 @@ class StockInfo:
     def get_futures(self):
         '''Returns the futures table from Yahoo Finance'''
 
-        tables = pd.read_html("https://finance.yahoo.com/commodities")
+        tables = pd.read_html(self.yahoo_url + "/commodities")
         result = tables[0]
         return result
 
@@ -1092,7 +1338,7 @@ class StockInfo:
     def get_undervalued_large_caps(self):
         '''Returns the undervalued large caps table from Yahoo Finance'''
 
-        tables = pd.read_html("https://finance.yahoo.com/screener/predefined/undervalued_large_caps?offset=0&count=100")
+        tables = pd.read_html(self.yahoo_url + "/screener/predefined/undervalued_large_caps?offset=0&count=100")
         result = tables[0]
         return result
 
@@ -1104,8 +1350,8 @@ class StockInfo:
            input ticker, including company name, book value, moving average data,
            pre-market / post-market price (when applicable), and more.'''
 
-        site = "https://query1.finance.yahoo.com/v7/finance/quote?symbols=" + ticker
-        resp = requests.get(site)
+        site = self.query_url + "/v7/finance/quote?symbols=" + ticker
+        resp = self._http_get(site)
         if not resp.ok:
             raise AssertionError("""Invalid response from server.  Check if ticker is
                                   valid.""")
@@ -1114,6 +1360,53 @@ class StockInfo:
         info = json_result["quoteResponse"]["result"]
         return info[0]
 
+    @timed("get_quote_data_batch")
+    def get_quote_data_batch(self, tickers, chunk_size = 500):
+        '''Inputs: @tickers
+
+           Same data as get_quote_data for many tickers at once, one request per
+           chunk_size symbols. Returns a data frame indexed by symbol; symbols
+           unknown to Yahoo are missing from the result.'''
+
+        rows = []
+        for i in range(0, len(tickers), chunk_size):
+            site = self.query_url + "/v7/finance/quote"
+            resp = self._http_get(site, params = {"symbols": ",".join(tickers[i:i + chunk_size])})
+            if not resp.ok:
+                raise AssertionError("Invalid response from server.")
+            rows += resp.json()["quoteResponse"]["result"]
+
+        frame = pd.DataFrame(rows)
+        if not frame.empty:
+            frame = frame.set_index("symbol")
+        return frame
+
+    def refresh_valuations(self, tickers = None):
+        '''Re-prices the valuations of already scanned tickers without scraping
+           statements or recomputing WACC inputs: one batched quote call provides
+           the prices and the 10 year bond rate (^TNX), and only the values
+           depending on them are recomputed.'''
+
+        if tickers is None:
+            tickers = self.valuation.tickers()
+
+        prices = self.get_live_quotes(tickers)[["regularMarketPrice"]]
+        self.valuation.update_input("prices", prices.rename(columns = {"regularMarketPrice": "price"}))
+        return self.valuation.get("valuation")
+
+    def get_live_quotes(self, tickers):
+        '''get_quote_data_batch of tickers with ^TNX added to the same call, which
+           refreshes the 10 year bond rate on the way; returns the tickers' quotes'''
+
+        quotes = self.get_quote_data_batch(list(tickers) + ["^TNX"])
+        if "^TNX" in quotes.index and not self._risk_free_rate_pinned:
+            rate = float(quotes.at["^TNX", "regularMarketPrice"])
+            self._get_market_cache().set("risk_free_rate", rate)
+            self._set_risk_free_rate(rate)
+        else:
+            self.risk_free_rate  # resolves the cached or scraped rate into the valuation graph
+        return quotes.drop("^TNX", errors = "ignore")
+
 
     def get_market_status(self):
         '''Returns the current state of the market - PRE, POST, OPEN, or CLOSED'''
@@ -1143,9 +1436,7 @@ class StockInfo:
         raise AssertionError("Postmarket price not currently available.")
 
     def get_cash_flow_for_all(self):
-        tickers_nyse_amex = self.tickers_other()
-        all_tickers_nasdaq = self.tickers_nasdaq()
-        #all_tickers = all_tickers_nasdaq + tickers_nyse_amex
+        #all_tickers = self.universe.tickers()
         all_tickers = stocks.all_stocks
 
         # undervalued_large_caps = get_undervalued_large_caps()
@@ -1160,62 +1451,120 @@ class StockInfo:
         # columns=["Ticker"]+["Date"] + ["FREE Cash Flow"] + cash_flow_columns.to_list()
         # cash_flow_df = pd.DataFrame(cash_flow_statements, columns=columns)
 
-        dt_now = datetime.datetime.now()
-        dt_string = dt_now.strftime("%Y%m%d_%H%M%S")
-
-        started = False
-        #for ticker in pg_stocks:
-        for ticker in all_tickers:
-            if self.stop_threads == True:
-                break
+        output = OutputWriter(self.output_directory, self.output_format, self.output_compression)
+        if self.metrics_interval:
+            self.metrics.start_export(self.output_directory, output.run_string + "_", self.metrics_interval)
 
-            if (self.starting_from_ticker == ""):
-                started = True
-
-            if(started == False):
-                if(ticker == self.starting_from_ticker):
+        # the export thread is stopped, and the last snapshot written, even when the scan fails
+        try:
+            if self.prescreen is not None:
+                candidates = set(self.prescreen.run(all_tickers))
+                output.write(self.prescreen.report.rename_axis("Ticker"), "prescreen", {"reason": "string"})
+            else:
+                candidates = set(all_tickers)
+
+            started = False
+            tickers = []
+            #for ticker in pg_stocks:
+            for ticker in all_tickers:
+                if (self.starting_from_ticker == ""):
                     started = True
-                continue
-
-            self.get_cash_flow_pg(ticker)
-            time.sleep(1)
-
-        fname = "C:/MyProjects/Indicators/DCF_screner/" + dt_string + "cash_flow.csv"
-        print(f"saving into {fname}")
-        cash_flow_for_all_df = pd.DataFrame(self.cash_flow_statements_for_all, columns=self.cash_flow_columns_all)
-        cash_flow_for_all_df.to_csv(fname)
 
-        fname = "C:/MyProjects/Indicators/DCF_screner/" + dt_string + "revenue.csv"
-        print(f"saving into {fname}")
-        cash_flow_for_all_df = pd.DataFrame(self.revenue_statements_for_all, columns=self.cash_flow_columns_all_revenue)
-        cash_flow_for_all_df.to_csv(fname)
-
-        fname = "C:/MyProjects/Indicators/DCF_screner/" + dt_string + "net_income.csv"
-        print(f"saving into {fname}")
-        cash_flow_for_all_df = pd.DataFrame(self.net_income_statements_for_all, columns=self.cash_flow_columns_all)
-        cash_flow_for_all_df.to_csv(fname)
+                if(started == False):
+                    if(ticker == self.starting_from_ticker):
+                        started = True
+                    continue
+
+                if ticker in candidates:
+                    tickers.append(ticker)
+
+            if self.profile_sample is not None:
+                self.profile_scan(sample_tickers(tickers, self.profile_sample),
+                                  os.path.join(self.profile_directory or self.output_directory,
+                                               output.run_string + "_profile"))
+            else:
+                self.scan_tickers(tickers, output.run_string)
+
+            # a profiled scan computed the WACC in collect_statements already
+            if self.batch_wacc and self.profile_sample is None:
+                self.fill_required_growth()
+                output.write(self.wacc_fallbacks.rename_axis("Ticker"), "wacc_fallbacks", {"reason": "string"})
+
+            for name, rows, columns in self.collected_tables():
+                cash_flow_for_all_df = pd.DataFrame(rows, columns=columns)
+                output.write(cash_flow_for_all_df, name, ticker_table_dtypes(cash_flow_for_all_df))
+
+            # kept under a fixed name so a later session can ValuationGraph.load() it and refresh_valuations()
+            fname = os.path.join(self.output_directory, "valuation_graph.pkl")
+            print(f"saving into {fname}")
+            self.valuation.save(fname)
+        finally:
+            self.metrics.stop_export(self.output_directory, output.run_string + "_")
+        print(self.metrics.summary())
+        print("DONE")
 
 
-        fname = "C:/MyProjects/Indicators/DCF_screner/" + dt_string + "required_growth.csv"
-        print(f"saving into {fname}")
-        cash_flow_for_all_df = pd.DataFrame(self.required_growth_for_all, columns=self.cash_flow_columns_growth)
-        cash_flow_for_all_df.to_csv(fname)
 
-        print("DONE")
+    def scan_tickers(self, tickers, run_string = ""):
+        '''Collects the statements of the tickers into the accumulators, through
+           the scan pipeline unless it is None; with the refresh scheduler on,
+           only the tickers it finds due are scraped again
 
+           @param: tickers
+           @param: run_string = "" - names the pipeline's scan log
+        '''
+        if self.use_refresh_scheduler:
+            self.refresh_tickers = set(self.scheduler.schedule(tickers))
 
+        if self.scan_pipeline is not None:
+            self.scan_pipeline.run(tickers, run_string)
+        else:
+            for ticker in tickers:
+                if self.stop_threads == True:
+                    break
+
+                self.get_cash_flow_pg(ticker)
+                if self.refresh_tickers is None or ticker in self.refresh_tickers:
+                    with self.metrics.timer("sleep"):
+                        time.sleep(1)
+
+    def profile_scan(self, tickers, directory):
+        '''Scans the tickers with a Profiler installed and writes its reports into
+           directory. The scan runs in this thread (no pipeline) and computes the
+           WACC of every ticker in collect_statements, so that _parse_json,
+           collect_statements, calc_wacc and get_marketwatch_data all show up.'''
+        scan_pipeline, batch_wacc = self.scan_pipeline, self.batch_wacc
+        self.scan_pipeline, self.batch_wacc = None, False
+        self.profiler = Profiler()
+        self.profiler.start()
+        try:
+            print(f"profiling {len(tickers)} tickers")
+            self.scan_tickers(tickers)
+            print(self.profiler.write_reports(directory, self.profile_top))
+        finally:
+            self.profiler.stop()
+            self.profiler = None
+            self.scan_pipeline, self.batch_wacc = scan_pipeline, batch_wacc
+
+    def collected_tables(self):
+        '''(name, rows, columns) of the cash_flow, revenue, net_income and
+           required_growth tables collected so far'''
+        return [("cash_flow", self.cash_flow_statements_for_all, self.cash_flow_columns_all),
+                ("revenue", self.revenue_statements_for_all, self.cash_flow_columns_all_revenue),
+                ("net_income", self.net_income_statements_for_all, self.cash_flow_columns_all),
+                ("required_growth", self.required_growth_for_all, self.cash_flow_columns_growth)]
 
     def dividend_cards_to_csv(self, dividend_cards, file_tag):
-        dt_now = datetime.datetime.now()
-        dt_string = dt_now.strftime("%Y%m%d_%H%M%S")
-
         dividend_cards_arr = []
         for dividend_card in dividend_cards:
             dividend_cards_arr.append(dividend_card.to_array())
         csvDataFrame = pd.DataFrame(dividend_cards_arr, columns=["ticker" ,"frequency" ,"dividend_yield" ,"payout", \
                                                                  "div_min" ,"div_max" ,"div_spread" ,"div_growth", \
                                                                  "price_min" ,"price_max" ,"price_spread" ,"price_growth"])
-        csvDataFrame.to_csv("C:/Users/USER/Downloads/yahoo_fin_news/" + dt_string + "_" + file_tag + "_dividend.csv")
+        dtypes = ticker_table_dtypes(csvDataFrame, "ticker")
+        dtypes["frequency"] = "int16"
+        output = OutputWriter(self.dividend_output_directory, self.output_format, self.output_compression)
+        output.write(csvDataFrame, file_tag + "_dividend", dtypes)
 
 
     def get_stock_price(self, ticker):
@@ -1281,10 +1630,8 @@ class StockInfo:
 
     # extract dividend payment metrics: yield, monthly/yearly/daily payment type
     def get_dividends_for_all(self):
-        tickers_nyse_amex = tickers_other()
-        all_tickers_nasdaq = tickers_nasdaq()
-        all_tickers = all_tickers_nasdaq + tickers_nyse_amex
-        all_tickers = sorted(all_tickers)
+        # listed equities of NASDAQ, NYSE and the other exchanges; ETFs and test issues are left out
+        all_tickers = self.universe.tickers()
 
         monthly = []
         quarterly = []
@@ -1334,53 +1681,96 @@ class StockInfo:
 
         return
 
+    @timed("fill_required_growth")
+    def fill_required_growth(self):
+        '''Computes the WACC of every ticker collected so far in one batch and
+           stores it in required_growth_for_all. Tickers that fell back to the
+           default WACC are kept in self.wacc_fallbacks with the reason.'''
+
+        engine = WaccEngine(self, cache_dir=self.cache_dir)
+        self.metrics.register_cache("wacc_fundamentals", engine.cache)
+        wacc = engine.compute([row[0] for row in self.required_growth_for_all])
+        for row in self.required_growth_for_all:
+            row[1] = float(wacc[row[0]])
+        today = datetime.date.today().isoformat()
+        self.warehouse.write_values([(row[0], "valuation", "wacc", today, row[1]) for row in self.required_growth_for_all])
+        self.wacc_fallbacks = engine.fallbacks
+        return wacc
+
+    def screen_fundamentals(self, rules = None, tickers = None):
+        '''Runs a Screen over the fundamentals already in the warehouse, without
+           any network call. Returns the passing tickers; the per-rule outcome is
+           in self.screen_results.
+
+           @param: rules = None - rule expressions, screening.DEFAULT_RULES if None
+           @param: tickers = None - all stored tickers if None
+        '''
+        screen = Screen(rules)
+        passed = screen.run(load_fundamentals(self.warehouse, tickers))
+        self.screen_results = screen.results
+        return passed
+
     def cash_flow_thread(self):
         self.stop_threads = False
         self.get_cash_flow_for_all()
 
     def str_to_float(self, str_val):
+        '''Converts MarketWatch figures such as "1.5M", "(320K)" or "2.1B" to float;
+           parentheses mean a negative value. Returns None for "-" and unparsable text.'''
         val = None
+        multipliers = {"K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
         try:
-            if(str_val.find("M") > 0):
-                val = float(str_val.split("M")[0])*10e6
-            if(str_val.find("B") > 0):
-                val = float(str_val.strip("()").split("B")[0])*10e9
+            str_val = str_val.strip().replace(",", "")
+            negative = str_val.startswith("(") and str_val.endswith(")")
+            str_val = str_val.strip("()")
+            multiplier = multipliers.get(str_val[-1:], 1)
+            if multiplier != 1:
+                str_val = str_val[:-1]
+            val = float(str_val)*multiplier
+            if negative:
+                val = -val
         except Exception as e:
             pass
         return val
 
+    @timed("get_marketwatch_data")
     def get_marketwatch_data(self, ticker):
         interest_expense_on_debth = 0
         pretax_income = 0
         income_taxes = 0
 
-        income_site = f"https://www.marketwatch.com/investing/stock/{ticker}/financials"
-
-        df_list = pd.read_html(income_site)
-        data_frame = df_list[4]
-        data_frame_transposed = data_frame.transpose()
+        income_site = f"{self.marketwatch_url}/investing/stock/{ticker}/financials"
 
-        for key, statement in data_frame.iterrows():
-            statement_values = statement.to_list()
-            if('Interest Expense on Debt  Interest Expense on Debt' == statement_values[0]):
-                interest_expense_on_debth = self.str_to_float(statement_values[5])
-            if(interest_expense_on_debth == 0):
-                if('Interest Expense  Interest Expense' == statement_values[0]):
-                    interest_expense_on_debth = self.str_to_float(statement_values[5])
-
-            if('Pretax Income  Pretax Income' == statement_values[0]):
-                pretax_income = self.str_to_float(statement_values[5])
-
-            if('Income Taxes  Income Taxes' == statement_values[0]):
-                income_taxes = self.str_to_float(statement_values[5])
-            if(income_taxes == 0):
-                if ('Income Tax  Income Tax' == statement_values[0]):
-                    income_taxes = self.str_to_float(statement_values[5])
+        labels = ["Interest Expense on Debt", "Interest Expense", "Pretax Income", "Income Taxes", "Income Tax"]
+        resp = self._http_get(income_site, headers={'User-Agent': 'Custom'}, stream=True)
+        try:
+            # a 403/404 or bot-check page has no table, and must not read as zeros
+            resp.raise_for_status()
+            resp.encoding = resp.encoding or "utf-8"
+            rows = read_income_statement_rows(resp.iter_content(chunk_size=64*1024, decode_unicode=True), labels)
+        finally:
+            resp.close()
+        if not rows:
+            raise AssertionError(f"none of {labels} in the income statement of {income_site}")
+
+        if "Interest Expense on Debt" in rows:
+            interest_expense_on_debth = self.str_to_float(rows["Interest Expense on Debt"])
+        if(interest_expense_on_debth == 0) and "Interest Expense" in rows:
+            interest_expense_on_debth = self.str_to_float(rows["Interest Expense"])
+
+        if "Pretax Income" in rows:
+            pretax_income = self.str_to_float(rows["Pretax Income"])
+
+        if "Income Taxes" in rows:
+            income_taxes = self.str_to_float(rows["Income Taxes"])
+        if(income_taxes == 0) and "Income Tax" in rows:
+            income_taxes = self.str_to_float(rows["Income Tax"])
 
         return interest_expense_on_debth, pretax_income, income_taxes
 
+    @timed("get_total_debt")
     def get_total_debt(self, ticker):
-        income_site = f"https://finance.yahoo.com/quote/{ticker}/balance-sheet"
+        income_site = f"{self.yahoo_url}/quote/{ticker}/balance-sheet"
         json_info = self._parse_json(income_site)
         json_info_sel = json_info["balanceSheetHistory"]["balanceSheetStatements"]
         data_frame = pd.DataFrame(json_info_sel)
@@ -1403,7 +1793,7 @@ class StockInfo:
         return total_debt
 
     def get_risk_free_rate(self):
-        income_site = f"https://finance.yahoo.com/bonds"
+        income_site = f"{self.yahoo_url}/bonds"
         json_info = self._parse_json1(income_site)
         json_info_sel = json_info["StreamDataStore"]["quoteData"]
         data_frame = pd.DataFrame(json_info_sel)
@@ -1414,8 +1804,9 @@ class StockInfo:
                 risk_free_rate = statement["regularMarketPrice"]
         return risk_free_rate
 
+    @timed("get_key_statistics")
     def get_key_statistics(self, ticker):
-        income_site = f"https://finance.yahoo.com/quote/{ticker}"
+        income_site = f"{self.yahoo_url}/quote/{ticker}"
         json_info = self._parse_json(income_site)
         json_info_sel = json_info["price"]
         market_cap = json_info_sel["marketCap"]
@@ -1425,6 +1816,7 @@ class StockInfo:
         shares_outstanding = json_info_sel["sharesOutstanding"]
         return shares_outstanding, market_cap, beta
 
+    @timed("calc_wacc")
     def calc_wacc(self, ticker):
         '''
         calculate ticker's WWAC as 'Required Return' parameter in DCF calculation
@@ -1456,6 +1848,16 @@ class StockInfo:
             Re = Rf + beta*(10 -Rf)
 
             waac = Wd*Rd * tax_rate + We*Re
+
+            self.valuation.update_input("wacc_inputs", pd.DataFrame({"total_debt": [total_debt],
+                                                                     "interest_expense": [interest_expense_on_debth],
+                                                                     "pretax_income": [pretax_income],
+                                                                     "income_taxes": [income_taxes],
+                                                                     "beta": [beta],
+                                                                     "shares_outstanding": [shares_outstanding]},
+                                                                    index=[ticker]))
+            # the quote page has no price field here, the implied one is what market_cap was built from
+            self.valuation.update_input("prices", pd.DataFrame({"price": [market_cap/shares_outstanding]}, index=[ticker]))
         except Exception as e:
             waac=1
             print(f"default WAAC ({waac}%) assigned for {ticker} ")
@@ -1468,8 +1870,13 @@ class StockInfo:
 
 
 if __name__ == '__main__':
+    import click
+
     si = StockInfo()
     si.starting_from_ticker = ""
+    # e.g. DCF_PROFILE_SAMPLE=20 or DCF_PROFILE_SAMPLE=AAPL,MSFT profiles instead of scanning
+    si.profile_sample = parse_sample(os.environ.get("DCF_PROFILE_SAMPLE"))
+    si.profile_directory = os.environ.get("DCF_PROFILE_DIR") or None
 
     cash_flow_thread = threading.Thread(target=si.cash_flow_thread)
     cash_flow_thread.start()
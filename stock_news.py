@@ -1,21 +1,33 @@
 
 
 
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from time import mktime
 
-import feedparser
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import pandas as pd
+from feed_fetcher import FeedFetcher
+from lazy_imports import lazy_import
+from news_scoring import SCORE_COLUMNS, get_news_scorer
+from news_store import NewsStore
+from output import OutputWriter
 from pg_stocks import pg_stocks
 
-csvDataFrameColumns = None
-csvDataArray = []
+# imported on first use, see lazy_imports
+feedparser = lazy_import("feedparser")
+pd = lazy_import("pandas")
 
 yf_rss_ticket_url = 'https://feeds.finance.yahoo.com/rss/2.0/headline?s=%s&region=US&lang=en-US'
 yf_rss_url = 'https://finance.yahoo.com/news/rssindex'
 
+def point_feeds_at(url):
+    '''Reads the Yahoo RSS feeds from url (e.g. a local stub_server.StubServer)'''
+    global yf_rss_ticket_url, yf_rss_url
+    url = url.rstrip("/")
+    yf_rss_ticket_url = url + '/rss/2.0/headline?s=%s&region=US&lang=en-US'
+    yf_rss_url = url + '/news/rssindex'
+
 def get_yf_rss():
     feed = feedparser.parse(yf_rss_url)
     return feed.entries
@@ -39,22 +51,16 @@ def print_scored_news(entry):
     print("\n{} {}: {}".format(str(entry['date']), str(entry['time']), entry['headline']))
     print("    SCORE compound: {} (neg: {} new: {} pos: {})".format(entry['compound'], entry['neg'], entry['neu'], entry['pos']))
 
-def scan_yf_news(score_threshold = 0.3, ticker = 'INTC'):
-    global csvDataFrameColumns
-    if(ticker != None):
-        entries = get_yf_ticker_rss(ticker)
-    else:
-        entries = get_yf_rss()
-
-    i = 0
+def parse_yf_news(entries, ticker):
+    '''Returns [ticker, date, time, headline] rows for feed entries; ticker is ""
+       for the general news feed'''
     all_news = []
     for entry in entries:
         published = entry['published_parsed']
         dt = datetime.fromtimestamp(mktime(published))
 
         # DEBUG prints
-        # print("\nSUMMARY " + str(i))
-        # print("\nTITLE #" + str(i) + ":" + entry['title'])
+        # print("\nTITLE: " + entry['title'])
         # print("   Publshed at " + str(dt.date()) + " " + str(dt.time()))
 
         news = []
@@ -66,62 +72,162 @@ def scan_yf_news(score_threshold = 0.3, ticker = 'INTC'):
         news.append(dt.time())
         news.append(entry['title'])
         all_news.append(news)
-        # print(entry['summary'])
-        # print(entry)
-        i = i + 1
-
+    return all_news
 
+def score_yf_news(all_news, scorer = None):
+    '''Scores the headlines of parse_yf_news rows in one batch, with the shared
+       VADER scorer unless another NewsScorer is given'''
     columns = ['ticker', 'date', 'time', 'headline']
 
-    # Instantiate the sentiment intensity analyzer
-    nltk.download("vader_lexicon")
-    vader = SentimentIntensityAnalyzer()
     # Convert the parsed_news list into a DataFrame called 'parsed_and_scored_news'
     parsed_and_scored_news = pd.DataFrame(all_news, columns=columns)
-    # Iterate through the headlines and get the polarity scores using vader
-    scores = parsed_and_scored_news['headline'].apply(vader.polarity_scores).tolist()
-
-    # DEBUG PRINT
-    # i = 0
-    # for score in scores:
-    #    #print("#{} neg: {} new: {} pos{} compound {}".format(i, score['neg'], score['neu'], score['pos'], score['compound']))
-    #    if score['compound'] > 0.3 or score['compound'] < -0.3:
-    #        print_ticker_news(ticker, entries[i], score)
-    #    i = i + 1
-
-    # Convert the 'scores' list of dicts into a DataFrame
-    scores_df = pd.DataFrame(scores)
-    # Join the DataFrames of the news and the list of dicts
+    # Get the polarity scores of all headlines using vader
+    if scorer is None:
+        scorer = get_news_scorer()
+    scores_df = scorer.score(parsed_and_scored_news['headline'])
+    # Join the DataFrames of the news and the scores
     parsed_and_scored_news = parsed_and_scored_news.join(scores_df, rsuffix='_right')
     # Convert the date column from string to datetime
     parsed_and_scored_news['date'] = pd.to_datetime(parsed_and_scored_news.date).dt.date
+    return parsed_and_scored_news
+
+def filter_scored_news(parsed_and_scored_news, score_threshold):
+    '''Rows of score_yf_news output whose compound score is above score_threshold
+       or below -score_threshold'''
+    compound = parsed_and_scored_news['compound']
+    return parsed_and_scored_news[(compound > score_threshold) | (compound < -score_threshold)]
+
+def print_news(news):
+    for news_item in news.to_dict('records'):
+        if news_item['ticker']:
+            print_scored_ticker_news(news_item)
+        else:
+            print_scored_news(news_item)
 
-    parsed_and_scored_news.head()
-    if csvDataFrameColumns is None:
-        csvDataFrameColumns = parsed_and_scored_news.columns
-    for index, news_item in parsed_and_scored_news.iterrows():
-        # DEBUG PRINT
-        # print(str(news_item['compound']))
-        if news_item['compound'] > score_threshold or news_item['compound'] < (-1*score_threshold):
-            csvDataArray.append(news_item.tolist())
-            if (ticker != None):
-                print_scored_ticker_news(news_item)
-            else:
-                print_scored_news(news_item)
-
-
-
-def get_all_news():
-    dt_now = datetime.now()
-    dt_string = dt_now.strftime("%Y%m%d_%H%M%S")
-
-    scan_yf_news(score_threshold=0.65, ticker=None)
-    # scan_yf_news(ticker='INTC')
+def scan_yf_news(score_threshold = 0.3, ticker = 'INTC', verbose = True):
+    '''Scores the headlines of a ticker's feed (or of the general news feed for
+       ticker=None) and returns those crossing score_threshold as a data frame.
+       Keeps no state, so several scans can run concurrently.'''
+    if(ticker != None):
+        entries = get_yf_ticker_rss(ticker)
+    else:
+        entries = get_yf_rss()
 
-    for ticker in pg_stocks:
-        scan_yf_news(score_threshold=0.65, ticker=ticker)
-    csvDataFrame = pd.DataFrame(csvDataArray, columns=csvDataFrameColumns)
-    csvDataFrame.to_csv("C:/Users/USER/Downloads/yahoo_fin_news/" + dt_string + ".csv")
+    parsed_and_scored_news = score_yf_news(parse_yf_news(entries, ticker))
+    news = filter_scored_news(parsed_and_scored_news, score_threshold)
+    if verbose:
+        print_news(news)
+    return news
+
+def scan_yf_news_for_tickers(tickers, score_threshold = 0.3, max_workers = 8):
+    '''scan_yf_news over several tickers on a thread pool; the per-ticker frames
+       are concatenated once at the end (an empty frame for no tickers)'''
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(lambda ticker: scan_yf_news(score_threshold, ticker, verbose=False), tickers))
+    if not frames:
+        return pd.DataFrame(columns=['ticker', 'date', 'time', 'headline'] + SCORE_COLUMNS)
+    news = pd.concat(frames, ignore_index=True)
+    print_news(news)
+    return news
+
+
+def news_guid(entry):
+    '''Stable id of a feed entry: its guid, else its link, else its title'''
+    return entry.get('id') or entry.get('link') or entry['title']
+
+def news_dedup_keys(entry):
+    '''Keys under which the same article is recognized in different feeds: a hash
+       of the title with case, punctuation and spacing normalized, and its link'''
+    title = " ".join(re.sub(r"[^\w\s]", " ", entry['title'].lower()).split())
+    keys = ["title:" + hashlib.sha1(title.encode()).hexdigest()]
+    if entry.get('link'):
+        keys.append("link:" + hashlib.sha1(entry['link'].split("?")[0].encode()).hexdigest())
+    return keys
+
+# columns of the headlines saved by get_all_news
+NEWS_DTYPES = {"ticker": "string", "date": "string", "time": "string", "headline": "string",
+               "neg": "float32", "neu": "float32", "pos": "float32", "compound": "float32", "guid": "string"}
+
+
+def get_all_news(store = None, tickers = None, scoring_processes = 1, output = None):
+    '''Scans the general news feed and the feeds of tickers (pg_stocks by default)
+       and saves the headlines crossing the threshold (a "news" table).
+
+       @param: store = None - NewsStore, the default local one if None
+       @param: tickers = None
+       @param: scoring_processes = 1 - processes to score with, 0 for all cores;
+                                       worth it for thousands of tickers
+       @param: output = None - OutputWriter, CSV into the downloads folder if None
+    '''
+    if output is None:
+        output = OutputWriter("C:/Users/USER/Downloads/yahoo_fin_news/")
+
+    # feeds are downloaded concurrently, unchanged ones (HTTP 304) bring no entries;
+    # an article found in several feeds is kept once and mapped to all their tickers,
+    # and only articles not in the news store yet are scored, in a single batch
+    feed_tickers = {yf_rss_url: None}
+    for ticker in (pg_stocks if tickers is None else tickers):
+        feed_tickers[yf_rss_ticket_url % ticker] = ticker
+
+    if store is not None:
+        _scan_news_feeds(store, feed_tickers, scoring_processes, output)
+        return
+    # the store opened here is closed here
+    store = NewsStore()
+    try:
+        _scan_news_feeds(store, feed_tickers, scoring_processes, output)
+    finally:
+        store.close()
+
+
+def _scan_news_feeds(store, feed_tickers, scoring_processes, output):
+    '''get_all_news on an open store; feed_tickers maps feed urls to tickers'''
+    fetcher = FeedFetcher()
+    run_guids = {}  # dedup key -> guid of the first entry seen with it in this run
+    # (guid, ticker) of articles repeated in this run; mapped once the articles are stored
+    duplicate_tickers = []
+    all_news = []
+    all_guids = []
+    # kept only once the headlines are stored, a failed run must not turn into 304s next time
+    feed_validators = {}
+    for url, entries, validators in fetcher.fetch(feed_tickers):
+        ticker = feed_tickers[url]
+        feed_validators[url] = validators
+        unique_entries = []
+        for entry in entries:
+            keys = news_dedup_keys(entry)
+            guid = next((run_guids[key] for key in keys if key in run_guids), None)
+            if guid is not None:
+                duplicate_tickers.append((guid, ticker or ""))
+                continue
+            guid = news_guid(entry)
+            for key in keys:
+                run_guids[key] = guid
+            unique_entries.append((entry, guid))
+
+        unseen = store.unseen([guid for entry, guid in unique_entries])
+        store.add_tickers([(guid, ticker or "") for entry, guid in unique_entries if guid not in unseen])
+
+        new_entries = [(entry, guid) for entry, guid in unique_entries if guid in unseen]
+        all_news += parse_yf_news([entry for entry, guid in new_entries], ticker)
+        all_guids += [guid for entry, guid in new_entries]
+    print("{} of {} feeds not modified since the previous run, {} duplicate and {} new headlines".format(
+        fetcher.not_modified, len(feed_tickers), len(duplicate_tickers), len(all_news)))
+
+    if scoring_processes == 1:
+        scored_news = score_yf_news(all_news, get_news_scorer())
+    else:
+        # a scorer of its own, its process pool is shut down right after
+        with get_news_scorer(processes=scoring_processes) as scorer:
+            scored_news = score_yf_news(all_news, scorer)
+    scored_news['guid'] = all_guids
+    scored_at = store.add(scored_news, duplicate_tickers)
+    for url, validators in feed_validators.items():
+        fetcher.remember(url, validators)
+
+    threshold_news = store.query(score_threshold=0.65, scored_since=scored_at)
+    print_news(threshold_news)
+    output.write(threshold_news, "news", NEWS_DTYPES)
 
 if __name__ == '__main__':
     #get_all_news()
@@ -0,0 +1,299 @@
+'''Local stand-in for the Yahoo Finance and MarketWatch endpoints StockInfo
+   reads, serving recorded (or generated) payloads, so that scans can be
+   benchmarked, and their concurrency and rate limiting tuned, without the
+   network. Latency, error rate, 429 throttling and payload size are
+   configurable.
+
+   python stub_server.py [--port 8800] [--fixtures DIR] [--latency 0.2] [--jitter 0.1]
+                         [--error-rate 0.02] [--rate-limit 5] [--burst 5] [--retry-after 1]
+                         [--payload-bytes 500000] [--seed 0]
+
+   and point a StockInfo at it with si.point_at(url), the news feeds with
+   stock_news.point_feeds_at(url).
+'''
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# fixture name -> file in a fixtures directory
+FIXTURE_FILES = {"quote_page": "quote_page.html",
+                 "chart": "chart.json",
+                 "quote": "quote.json",
+                 "marketwatch_financials": "marketwatch_financials.html",
+                 "bonds": "bonds.html",
+                 "earnings_calendar": "earnings_calendar.html",
+                 "rss": "rss.xml"}
+
+
+def _root_app_page(stores):
+    # the layout _parse_json, _parse_json1 and _parse_earnings_json cut the JSON out of
+    data = {"context": {"dispatcher": {"stores": stores}}}
+    return "<html><body><script>\nroot.App.main = " + json.dumps(data) + ";\n}(this));\n</script></body></html>"
+
+
+def _raw(value):
+    return {"raw": value, "fmt": str(value)}
+
+
+def synthetic_fixtures(years = 4, days = 2500, headlines = 50):
+    '''Payloads shaped like the real ones, with growing cash flows so that the
+       tickers pass collect_statements'''
+    this_year = datetime.now().year
+    cash_flows = []
+    income_statements = []
+    balance_sheets = []
+    for i in range(years):
+        end_date = _raw(int(datetime(this_year - 1 - i, 12, 31).timestamp()))
+        cash_flows.append({"maxAge": 1, "endDate": end_date,
+                           "netIncome": _raw(900_000 - 50_000*i),
+                           "totalCashFromOperatingActivities": _raw(1_500_000 - 100_000*i),
+                           "capitalExpenditures": _raw(-300_000),
+                           "totalCashflowsFromInvestingActivities": _raw(-400_000),
+                           "totalCashFromFinancingActivities": _raw(-200_000),
+                           "otherCashflowsFromFinancingActivities": _raw(-10_000),
+                           "depreciation": {}, "changeToNetincome": _raw(5_000)})
+        # collect_statements reads the revenue from the 16th column
+        statement = {"maxAge": 1, "endDate": end_date}
+        for field in ("researchDevelopment", "effectOfAccountingCharges", "incomeBeforeTax", "minorityInterest",
+                      "netIncome", "sellingGeneralAdministrative", "grossProfit", "ebit", "operatingIncome",
+                      "otherOperatingExpenses", "interestExpense", "extraordinaryItems", "nonRecurring",
+                      "otherItems", "incomeTaxExpense"):
+            statement[field] = _raw(100_000)
+        statement["totalRevenue"] = _raw(10_000_000 - 500_000*i)
+        statement["costOfRevenue"] = _raw(6_000_000)
+        income_statements.append(statement)
+        balance_sheets.append({"maxAge": 1, "endDate": end_date, "longTermDebt": _raw(2_000_000),
+                               "totalAssets": _raw(20_000_000)})
+
+    trend = [{"maxAge": 1, "period": period, "endDate": f"{this_year + offset}-12-31",
+              "revenueEstimate": {"avg": _raw(11_000_000 + 500_000*offset)}}
+             for period, offset in (("0q", 0), ("0y", 0), ("+1y", 1))]
+    store = {"cashflowStatementHistory": {"cashflowStatements": cash_flows, "maxAge": 1},
+             "incomeStatementHistory": {"incomeStatementHistory": income_statements, "maxAge": 1},
+             "balanceSheetHistory": {"balanceSheetStatements": balance_sheets, "maxAge": 1},
+             "earningsTrend": {"trend": trend, "maxAge": 1},
+             "price": {"marketCap": _raw(50_000_000), "regularMarketPrice": _raw(25.0)},
+             "defaultKeyStatistics": {"beta": _raw(1.1), "sharesOutstanding": _raw(2_000_000)},
+             "calendarEvents": {"earnings": {"earningsDate": [_raw(int(time.time()) + 30*24*3600)]}}}
+
+    start = int(time.time()) - days*24*3600
+    timestamps = [start + i*24*3600 for i in range(days)]
+    closes = [20 + 5*((i % 200)/200) for i in range(days)]
+    chart = {"chart": {"result": [{"meta": {"currency": "USD"},
+                                   "timestamp": timestamps,
+                                   "indicators": {"quote": [{"open": closes, "high": closes, "low": closes,
+                                                             "close": closes, "volume": [1000]*days}],
+                                                  "adjclose": [{"adjclose": closes}]}}],
+                       "error": None}}
+
+    years_row = "".join(f"<th>{this_year - years + i}</th>" for i in range(years))
+    rows = "".join(f"<tr><td>{label} {label}</td>" + "<td>1.5M</td>"*years + "</tr>"
+                   for label in ("Sales/Revenue", "Interest Expense", "Pretax Income", "Income Taxes"))
+    marketwatch = f"<html><body><table><tr><th>Item</th>{years_row}</tr>{rows}</table></body></html>"
+
+    items = "".join(f"<item><title>Headline {i}: company beats expectations</title>"
+                    f"<link>https://finance.yahoo.com/news/headline-{i}.html</link>"
+                    f"<guid>headline-{i}</guid>"
+                    f"<pubDate>{format_datetime(datetime.now() - timedelta(hours=i))}</pubDate></item>"
+                    for i in range(headlines))
+    rss = f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>Yahoo</title>{items}</channel></rss>'
+
+    calendar_rows = [{"ticker": f"T{i}", "companyshortname": f"Company {i}",
+                      "startdatetime": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.000Z")} for i in range(20)]
+    return {"quote_page": _root_app_page({"QuoteSummaryStore": store}),
+            "chart": json.dumps(chart),
+            "quote": json.dumps({"symbol": "", "quoteType": "EQUITY", "marketCap": 50_000_000,
+                                 "regularMarketPrice": 25.0, "epsTrailingTwelveMonths": 1.2}),
+            "marketwatch_financials": marketwatch,
+            "bonds": _root_app_page({"StreamDataStore": {"quoteData": {"^TNX": {"regularMarketPrice": _raw(1.5)}}}}),
+            "earnings_calendar": _root_app_page({"ScreenerCriteriaStore": {"meta": {"total": len(calendar_rows)}},
+                                                 "ScreenerResultsStore": {"results": {"rows": calendar_rows}}}),
+            "rss": rss}
+
+
+def load_fixtures(directory = None):
+    '''Recorded payloads from directory (see FIXTURE_FILES), generated ones for
+       those missing or when directory is None'''
+    fixtures = synthetic_fixtures()
+    if directory is not None:
+        for name, file_name in FIXTURE_FILES.items():
+            path = os.path.join(directory, file_name)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    fixtures[name] = f.read()
+    return fixtures
+
+
+# (path pattern, fixture, content type)
+ROUTES = [(r"^/v8/finance/chart/[^/]+$", "chart", "application/json"),
+          (r"^/v7/finance/quote$", "quote", "application/json"),
+          (r"^/investing/stock/[^/]+/financials$", "marketwatch_financials", "text/html"),
+          (r"^/bonds$", "bonds", "text/html"),
+          (r"^/calendar/earnings$", "earnings_calendar", "text/html"),
+          (r"^/quote/[^/]+(/[a-z-]+)?$", "quote_page", "text/html"),
+          (r"^/(rss/2\.0/headline|news/rssindex)$", "rss", "application/rss+xml")]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type = "text/plain", headers = None):
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        for pattern, fixture, content_type in ROUTES:
+            if re.match(pattern, url.path):
+                break
+        else:
+            self._send(404, "not found")
+            return
+
+        server = self.server.stub
+        status, headers = server.admit(fixture)
+        if status != 200:
+            self._send(status, "throttled" if status == 429 else "server error", headers=headers)
+            return
+
+        body = server.fixtures[fixture]
+        if fixture == "quote":
+            # one result per requested symbol
+            symbols = parse_qs(url.query).get("symbols", [""])[0].split(",")
+            template = json.loads(body)
+            body = json.dumps({"quoteResponse": {"result": [dict(template, symbol=symbol) for symbol in symbols if symbol],
+                                                 "error": None}})
+        if len(body) < server.payload_bytes:
+            # trailing whitespace is valid in every served format
+            body += " "*(server.payload_bytes - len(body))
+        self._send(200, body, content_type)
+
+
+class StubServer:
+    '''Threaded HTTP server answering the ROUTES from fixtures (a dict from
+       load_fixtures). Usable as a context manager; url is known after start().
+
+       Every answer is delayed by latency seconds plus up to jitter more. Beyond
+       rate_limit requests per second (a token bucket holding burst requests, a
+       second of them by default and at least one) the server answers 429 with a Retry-After of retry_after
+       seconds, and a random error_rate of the admitted requests get a 503.
+       Bodies shorter than payload_bytes are padded to it. The random draws come
+       from seed, so a run can be repeated.
+
+       self.requests counts the requests per fixture, self.statuses the answers
+       per status code.
+    '''
+
+    def __init__(self, fixtures = None, host = "127.0.0.1", port = 0, latency = 0.0, jitter = 0.0,
+                 error_rate = 0.0, rate_limit = None, retry_after = 1, payload_bytes = 0, seed = 0, burst = None):
+        self.fixtures = fixtures if fixtures is not None else load_fixtures()
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = max(1, burst if burst is not None else rate_limit or 0)
+        self.retry_after = retry_after
+        self.payload_bytes = payload_bytes
+        self.requests = {}
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._tokens = self.burst
+        self._tokens_at = time.monotonic()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self._httpd.server_address[1]}"
+
+    def admit(self, fixture):
+        '''Counts a request for fixture, waits out the latency and decides its
+           status; returns (status, headers)'''
+        with self.lock:
+            self.requests[fixture] = self.requests.get(fixture, 0) + 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            status, headers = 200, {}
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._tokens_at)*self.rate_limit)
+                self._tokens_at = now
+                if self._tokens < 1:
+                    status, headers = 429, {"Retry-After": str(math.ceil(self.retry_after))}
+                else:
+                    self._tokens -= 1
+            if status == 200 and self._random.random() < self.error_rate:
+                status = 503
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        if delay > 0:
+            time.sleep(delay)
+        return status, headers
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--fixtures", help="directory of recorded payloads, generated ones if not given")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every answer is delayed")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds of delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--rate-limit", type=float, help="requests per second beyond which 429 is answered")
+    parser.add_argument("--burst", type=float, help="requests accepted at once (at least 1), the rate limit if not given")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds of a 429")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="pad smaller bodies to this size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubServer(load_fixtures(args.fixtures), args.host, args.port, args.latency, args.jitter,
+                        args.error_rate, args.rate_limit, args.retry_after, args.payload_bytes, args.seed, args.burst).start()
+    print(f"serving on {server.url}, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        print(f"requests: {server.requests}, answers: {server.statuses}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from distributed_scan import WorkQueue
+
+TICKERS = [f"T{i:03d}" for i in range(10)]
+
+
+def new_queue(tmp_path, shard_size = 3):
+    work_queue = WorkQueue(str(tmp_path / "scan.sqlite"))
+    work_queue.create(TICKERS, shard_size)
+    return work_queue
+
+
+def test_claim_in_shard_order(tmp_path):
+    work_queue = new_queue(tmp_path)
+    assert work_queue.shard_ids() == [0, 1, 2, 3]
+    assert work_queue.claim("a", 60) == (0, TICKERS[0:3])
+    assert work_queue.claim("b", 60) == (1, TICKERS[3:6])
+    assert work_queue.claim("a", 60) == (2, TICKERS[6:9])
+    assert work_queue.claim("b", 60) == (3, TICKERS[9:])
+    assert work_queue.claim("c", 60) is None
+    assert work_queue.status() == {"leased": 4}
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    work_queue = new_queue(tmp_path, shard_size=10)
+    # a lease that has run out already, as if its worker died
+    assert work_queue.claim("dead", -1) == (0, TICKERS)
+    assert work_queue.status() == {"expired": 1}
+    assert work_queue.claim("alive", 60) == (0, TICKERS)
+    assert not work_queue.complete(0, "dead")
+    assert work_queue.complete(0, "alive")
+    assert work_queue.claim("other", 60) is None
+    assert work_queue.status() == {"done": 1}
+
+
+def test_concurrent_claims_get_distinct_shards(tmp_path):
+    new_queue(tmp_path, shard_size=1)
+    claimed = []
+    lock = threading.Lock()
+
+    def work(worker):
+        # a connection per worker, like separate processes sharing the file
+        work_queue = WorkQueue(str(tmp_path / "scan.sqlite"))
+        while True:
+            shard = work_queue.claim(worker, 60)
+            if shard is None:
+                return
+            with lock:
+                claimed.append(shard[0])
+            work_queue.complete(shard[0], worker)
+
+    workers = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sorted(claimed) == list(range(len(TICKERS)))
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marketwatch import read_income_statement_rows
+from stock_info import StockInfo
+
+LABELS = ["Interest Expense", "Pretax Income", "Income Taxes"]
+
+
+def table(header, rows):
+    cells = lambda row, tag: "".join(f"<{tag}>{cell}</{tag}>" for cell in row)
+    return ("<table><tr>" + cells(header, "th") + "</tr>"
+            + "".join("<tr>" + cells(row, "td") + "</tr>" for row in rows) + "</table>")
+
+
+@pytest.fixture
+def stock_info(tmp_path):
+    return StockInfo(risk_free_rate=1.5, cache_dir=str(tmp_path))
+
+
+@pytest.mark.parametrize("text, value", [
+    ("1.5M", 1.5e6),
+    ("320K", 320e3),
+    ("2.1B", 2.1e9),
+    ("1T", 1e12),
+    ("(320K)", -320e3),
+    ("(1,234.5)", -1234.5),
+    (" 42 ", 42.0),
+    ("-", None),
+    ("", None),
+    ("n/a", None),
+])
+def test_str_to_float(stock_info, text, value):
+    assert stock_info.str_to_float(text) == value
+
+
+def test_read_income_statement_rows_latest_year_first():
+    page = table(["Item", "2023", "2021", "2022", "5-year trend"],
+                 [["Income Taxes Income Taxes", "30M", "10M", "20M", ""],
+                  ["Sales/Revenue Sales/Revenue", "1B", "800M", "900M", ""],
+                  ["Pretax Income Pretax Income", "(5M)", "1M", "2M", ""],
+                  ["Interest Expense Interest Expense", "7M", "5M", "6M", ""]])
+    values = read_income_statement_rows([page], LABELS)
+    assert values == {"Income Taxes": "30M", "Pretax Income": "(5M)", "Interest Expense": "7M"}
+
+
+def test_read_income_statement_rows_skips_other_tables_and_split_chunks():
+    quote = table(["Symbol", "2024"], [["Pretax Income", "999M"]])
+    income = table(["Item Item", "2020", "2021"], [["Pretax Income Pretax Income", "1M", "2M"]])
+    page = "<html><body>" + quote + income + "</body></html>"
+    chunks = [page[i:i + 7] for i in range(0, len(page), 7)]
+    assert read_income_statement_rows(chunks, LABELS) == {"Pretax Income": "2M"}
+
+
+def test_read_income_statement_rows_without_table():
+    with pytest.raises(AssertionError):
+        read_income_statement_rows(["<html><p>Please verify you are a human</p></html>"], LABELS)
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stock_news
+from news_store import NewsStore
+from output import OutputWriter
+
+
+class FakeFetcher:
+    '''Serves fixed entries per feed url instead of downloading'''
+
+    feeds = {}
+
+    def __init__(self):
+        self.not_modified = 0
+
+    def fetch(self, urls):
+        for url in urls:
+            yield url, self.feeds.get(url, []), None
+
+    def remember(self, url, validators):
+        pass
+
+
+class FakeScorer:
+    def score(self, headlines):
+        headlines = list(headlines)
+        return pd.DataFrame({"neg": [0.0]*len(headlines), "neu": [0.5]*len(headlines),
+                             "pos": [0.5]*len(headlines), "compound": [0.8]*len(headlines)})
+
+
+def entry(guid, title):
+    return {"id": guid, "link": "https://example.com/" + guid, "title": title,
+            "published_parsed": time.localtime(time.time() - 3600)}
+
+
+def test_article_repeated_in_two_feeds_counts_for_both_tickers(tmp_path, monkeypatch):
+    shared = entry("g", "Both companies announce a merger")
+    monkeypatch.setattr(FakeFetcher, "feeds", {stock_news.yf_rss_ticket_url % "AAA": [shared],
+                                               stock_news.yf_rss_ticket_url % "BBB": [dict(shared)]})
+    monkeypatch.setattr(stock_news, "FeedFetcher", FakeFetcher)
+    monkeypatch.setattr(stock_news, "get_news_scorer", lambda **kwargs: FakeScorer())
+
+    store = NewsStore(str(tmp_path / "news.sqlite"))
+    stock_news.get_all_news(store=store, tickers=["AAA", "BBB"], output=OutputWriter(str(tmp_path)))
+
+    series = store.sentiment_series()
+    assert sorted(series["ticker"]) == ["AAA", "BBB"]
+    assert series["count"].tolist() == [1, 1]
+
+    # the incrementally kept table matches a full rebuild
+    before = series.to_dict("records")
+    store.rebuild_sentiment()
+    assert store.sentiment_series().to_dict("records") == before
+    store.close()
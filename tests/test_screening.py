@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screening import Screen
+
+NAN = float("nan")
+
+
+def panel(fcf, wacc = None):
+    '''load_fundamentals-like frame from {ticker: [fcf per year from 2019]}'''
+    rows = []
+    for ticker, values in fcf.items():
+        for i, value in enumerate(values):
+            rows.append({"ticker": ticker, "period_end": f"{2019 + i}-12-31", "fcf": value,
+                         "year": 2019 + i, "wacc": (wacc or {}).get(ticker, NAN)})
+    return pd.DataFrame(rows).set_index(["ticker", "period_end"]).sort_index()
+
+
+def test_default_rules():
+    fundamentals = panel({"GROW": [1, 2, 2, 3],
+                          "GAP": [1, 2, 3, NAN],
+                          "SHORT": [1, 2, 3],
+                          "FALL": [4, 3, 2, 1],
+                          "LOSS": [-1, 1, 2, 3]})
+    screen = Screen()
+    assert screen.run(fundamentals) == ["GROW"]
+    # a missing latest year is not replaced by an older one
+    assert not screen.results.loc["GAP", "fcf > 0 over 4y"]
+    assert not screen.results.loc["GAP", "fcf monotonic over 4y"]
+    assert not screen.results.loc["SHORT", "year >= 2010 over 4y"]
+    assert screen.results.loc["FALL", "fcf > 0 over 4y"]
+    assert not screen.results.loc["FALL", "fcf monotonic over 4y"]
+    assert not screen.results.loc["LOSS", "fcf > 0 over 4y"]
+    assert screen.results.loc["LOSS", "fcf monotonic over 4y"]
+
+
+def test_latest_value_and_window():
+    fundamentals = panel({"A": [-5, 1, 2], "B": [1, 2, NAN], "C": [1, -2, 3]})
+    assert Screen(["fcf > 0"]).run(fundamentals) == ["A", "C"]
+    assert Screen(["fcf > 0 over 2y"]).run(fundamentals) == ["A"]
+    assert Screen(["fcf monotonic decreasing over 2y"]).run(fundamentals) == []
+
+
+def test_between_percent():
+    fundamentals = panel({"A": [1], "B": [1], "C": [1]}, wacc={"A": 0.05, "B": 0.13})
+    assert Screen(["wacc between 5% and 12%"]).run(fundamentals) == ["A"]
+
+
+def test_bad_rules():
+    with pytest.raises(AssertionError):
+        Screen(["fcf is large"])
+    with pytest.raises(AssertionError):
+        Screen(["ebitda > 0"]).run(panel({"A": [1]}))
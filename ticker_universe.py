@@ -0,0 +1,141 @@
+import io
+import re
+
+from cache import FileCache
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+SYMBOL_DIRECTORIES = {"nasdaq": "nasdaqlisted.txt", "other": "otherlisted.txt"}
+
+# otherlisted.txt exchange codes; everything in nasdaqlisted.txt is NASDAQ
+EXCHANGES = {"Q": "NASDAQ", "N": "NYSE", "A": "NYSE MKT", "P": "NYSE ARCA", "Z": "BATS", "V": "IEXG"}
+
+# StockInfo.tickers_<name> methods that can be unioned into the universe
+INDEX_SOURCES = ("sp500", "dow", "ftse100", "ftse250", "ibovespa", "nifty50", "niftybank")
+
+# Yahoo exchange suffix of index lists given in local codes (FTSE EPIC codes)
+INDEX_SUFFIXES = {"ftse100": ".L", "ftse250": ".L"}
+
+# warrants, units, rights and preferreds: "$" marks a preferred series in the
+# directories, ".W"/".WS", ".U" and ".R"/".RT" suffixes the others
+NON_EQUITY_SYMBOL = re.compile(r"\$|\.(?:W|WS|U|R|RT)$")
+NON_EQUITY_NAME = re.compile(r"\b(?:Warrants?|Rights?|Units?|Preferred)\b", re.IGNORECASE)
+# partnership interests are traded as units too
+EQUITY_UNITS_NAME = re.compile(r"\bCommon Units?\b", re.IGNORECASE)
+
+
+class TickerUniverse:
+    '''Builds scan lists from the NASDAQ Trader symbol directories and the index
+       constituent lists of StockInfo.
+
+       The symbol directories are downloaded at most once per ttl (a day by
+       default) into a file cache shared by all processes and parsed as the pipe
+       delimited tables they are, keeping the ETF, test issue and exchange
+       columns and flagging warrants, units, rights and preferreds by symbol
+       suffix and security name, so non-equities and test issues are dropped
+       before any scrape. Index lists are cached the same way, and FTSE codes
+       get Yahoo's ".L" suffix.
+    '''
+
+    def __init__(self, stock_info, ttl = 24*3600, cache_dir = None):
+        self.stock_info = stock_info
+        self.cache = FileCache("ticker_universe", ttl=ttl, cache_dir=cache_dir)
+        self._directories = {}
+        self._listings = None
+
+    def _download_symbol_directory(self, file_name):
+        import ftplib
+
+        ftp = ftplib.FTP("ftp.nasdaqtrader.com")
+        ftp.login()
+        ftp.cwd("SymbolDirectory")
+        r = io.BytesIO()
+        ftp.retrbinary('RETR ' + file_name, r.write)
+        ftp.close()
+        return r.getvalue().decode()
+
+    def symbol_directory(self, name):
+        '''The "nasdaq" (nasdaqlisted.txt) or "other" (otherlisted.txt) symbol
+           directory as a data frame with the file's own columns'''
+        if name not in self._directories:
+            text = self.cache.get(name)
+            if text is None:
+                text = self._download_symbol_directory(SYMBOL_DIRECTORIES[name])
+                self.cache.set(name, text)
+
+            data = pd.read_csv(io.StringIO(text), sep="|", dtype=str, keep_default_na=False)
+            # the last line is "File Creation Time: ..."
+            data = data[~data.iloc[:, 0].str.startswith("File Creation Time")]
+            self._directories[name] = data.reset_index(drop=True)
+        return self._directories[name]
+
+    def listings(self):
+        '''All listed symbols of both directories, indexed by Yahoo-style symbol
+           (BRK-B rather than BRK.B), with name, exchange, etf, test_issue and
+           non_equity columns'''
+        if self._listings is None:
+            nasdaq = self.symbol_directory("nasdaq")
+            other = self.symbol_directory("other")
+            frames = [pd.DataFrame({"symbol": nasdaq["Symbol"],
+                                    "name": nasdaq["Security Name"],
+                                    "exchange": "NASDAQ",
+                                    "etf": nasdaq["ETF"] == "Y",
+                                    "test_issue": nasdaq["Test Issue"] == "Y"}),
+                      pd.DataFrame({"symbol": other["ACT Symbol"],
+                                    "name": other["Security Name"],
+                                    "exchange": other["Exchange"].map(EXCHANGES).fillna(other["Exchange"]),
+                                    "etf": other["ETF"] == "Y",
+                                    "test_issue": other["Test Issue"] == "Y"})]
+            listings = pd.concat(frames, ignore_index=True)
+            listings["non_equity"] = (listings["symbol"].str.contains(NON_EQUITY_SYMBOL)
+                                      | (listings["name"].str.contains(NON_EQUITY_NAME)
+                                         & ~listings["name"].str.contains(EQUITY_UNITS_NAME)))
+            listings["symbol"] = listings["symbol"].str.replace(".", "-", regex=False)
+            self._listings = listings.drop_duplicates("symbol").set_index("symbol").sort_index()
+        return self._listings
+
+    def index_members(self, name):
+        '''Constituents of an index from INDEX_SOURCES as Yahoo symbols, cached
+           like the directories'''
+        if name not in INDEX_SOURCES:
+            raise AssertionError(f"index must be one of {INDEX_SOURCES}")
+        tickers = self.cache.get("index_" + name)
+        if tickers is None:
+            tickers = [str(ticker) for ticker in getattr(self.stock_info, "tickers_" + name)()]
+            self.cache.set("index_" + name, tickers)
+        suffix = INDEX_SUFFIXES.get(name)
+        if suffix is not None:
+            # EPIC codes such as "BT.A" or "BP." are "BT-A.L" and "BP.L" on Yahoo
+            tickers = [ticker if ticker.endswith(suffix) else ticker.rstrip(".").replace(".", "-") + suffix
+                       for ticker in tickers]
+        return tickers
+
+    def tickers(self, directories = True, indexes = (), include_etfs = False,
+                include_test_issues = False, exchanges = None, include_non_equities = False):
+        '''Sorted, de-duplicated scan list.
+
+           @param: directories = True - include every symbol of the symbol directories
+           @param: indexes = () - names from INDEX_SOURCES to union in
+           @param: include_etfs = False
+           @param: include_test_issues = False
+           @param: exchanges = None - e.g. ["NASDAQ", "NYSE"]; all if None
+           @param: include_non_equities = False - warrants, units, rights and preferreds
+        '''
+        tickers = set()
+        if directories:
+            listings = self.listings()
+            selected = pd.Series(True, index=listings.index)
+            if not include_etfs:
+                selected &= ~listings["etf"]
+            if not include_test_issues:
+                selected &= ~listings["test_issue"]
+            if not include_non_equities:
+                selected &= ~listings["non_equity"]
+            if exchanges is not None:
+                selected &= listings["exchange"].isin(exchanges)
+            tickers.update(listings.index[selected])
+
+        for name in indexes:
+            tickers.update(self.index_members(name))
+        return sorted(tickers)
@@ -0,0 +1,165 @@
+import pickle
+import threading
+
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# see StockInfo.calc_wacc: expected market return (percent) and the fallback WACC (percent)
+MARKET_RETURN = 10
+DEFAULT_WACC = 1
+
+
+def compute_wacc(wacc_inputs, market_cap, risk_free_rate, default = DEFAULT_WACC):
+    '''Vectorized StockInfo.calc_wacc for every ticker of a ticker-indexed frame.
+       Returns WACC as a fraction; tickers whose inputs are missing or degenerate
+       get default (in percent, like calc_wacc's fallback).
+
+       @param: wacc_inputs - frame with total_debt, interest_expense, pretax_income,
+                             income_taxes and beta columns
+       @param: market_cap - series indexed by ticker
+       @param: risk_free_rate - 10 year bond rate, in percent
+       @param: default = DEFAULT_WACC - pass np.nan to find out which tickers fell back
+    '''
+    total_debt = wacc_inputs["total_debt"].astype(float)
+    market_cap = market_cap.reindex(wacc_inputs.index).astype(float)
+
+    Wd = total_debt / (total_debt + market_cap)
+    We = market_cap / (total_debt + market_cap)
+
+    interest_expense = wacc_inputs["interest_expense"].astype(float)
+    interest_expense = interest_expense.where(interest_expense.notna() & (interest_expense != 0), total_debt)
+    Rd = (total_debt / interest_expense).where(total_debt != 0, 1.0)
+
+    tax_rate = wacc_inputs["income_taxes"].astype(float) / wacc_inputs["pretax_income"].astype(float)
+
+    Rf = float(risk_free_rate)
+    Re = Rf + wacc_inputs["beta"].astype(float) * (MARKET_RETURN - Rf)
+
+    waac = Wd * Rd * tax_rate + We * Re
+    waac = waac.replace([np.inf, -np.inf], np.nan).fillna(default)
+    return waac / 100
+
+
+def compute_dcf(fcf, wacc, shares_outstanding, price, perpetual_growth_rate):
+    '''Values the latest free cash flow as a growing perpetuity discounted at WACC.
+       Returns a ticker-indexed frame with the intrinsic value per share and the
+       upside versus the current price. Tickers whose WACC does not exceed the
+       perpetual growth rate have no meaningful value and are left as NaN.
+    '''
+    index = fcf.index
+    wacc = wacc.reindex(index)
+    spread = (wacc - perpetual_growth_rate).where(wacc > perpetual_growth_rate)
+    value = fcf * (1 + perpetual_growth_rate) / spread
+    value_per_share = value / shares_outstanding.reindex(index)
+    price = price.reindex(index)
+
+    frame = pd.DataFrame({"fcf": fcf,
+                          "wacc": wacc,
+                          "price": price,
+                          "value_per_share": value_per_share,
+                          "upside": value_per_share / price - 1},
+                         index=index)
+    return frame.replace([np.inf, -np.inf], np.nan)
+
+
+class ValuationGraph:
+    '''Dependency-tracked valuation state for a ticker universe.
+
+       Inputs are "statements" (latest annual figures per ticker), "wacc_inputs"
+       (debt, interest, tax and beta per ticker), "risk_free_rate" and "prices".
+       Every update bumps the input's version. Derived values remember the versions
+       of the values they were computed from and are recomputed lazily, only when
+       one of those changed - new prices re-run market_cap, wacc and valuation but
+       never touch the statements.
+    '''
+    INPUTS = ("statements", "wacc_inputs", "risk_free_rate", "prices")
+
+    def __init__(self, perpetual_growth_rate=0.025):
+        self.perpetual_growth_rate = perpetual_growth_rate
+
+        self._lock = threading.RLock()
+        self._values = {name: None for name in self.INPUTS}
+        self._versions = {name: 0 for name in self.INPUTS}
+        self._derived = {}          # name -> (dependencies, function)
+        self._computed_from = {}    # name -> versions of the dependencies last used
+        self.recompute_count = {}
+
+        self.add_derived("market_cap", ("prices", "wacc_inputs"),
+                         lambda prices, wacc_inputs: prices["price"] * wacc_inputs["shares_outstanding"])
+        self.add_derived("wacc", ("wacc_inputs", "market_cap", "risk_free_rate"), compute_wacc)
+        self.add_derived("valuation", ("statements", "wacc", "wacc_inputs", "prices"),
+                         lambda statements, wacc, wacc_inputs, prices: compute_dcf(
+                             statements["fcf"], wacc, wacc_inputs["shares_outstanding"],
+                             prices["price"], self.perpetual_growth_rate))
+
+    def add_derived(self, name, dependencies, function):
+        '''Registers a derived value computed by function(*dependency_values)'''
+        with self._lock:
+            self._derived[name] = (tuple(dependencies), function)
+            self._versions[name] = 0
+            self._computed_from.pop(name, None)
+
+    def set_input(self, name, value):
+        '''Replaces an input as a whole and bumps its version'''
+        if name not in self.INPUTS:
+            raise KeyError(f"unknown valuation input '{name}'")
+        with self._lock:
+            self._values[name] = value
+            self._versions[name] += 1
+
+    def update_input(self, name, frame):
+        '''Upserts the rows of a ticker-indexed frame into an input and bumps its version'''
+        with self._lock:
+            current = self._values.get(name)
+            if current is not None:
+                frame = pd.concat([current.drop(frame.index, errors="ignore"), frame])
+            self.set_input(name, frame)
+
+    def version(self, name):
+        with self._lock:
+            if name in self._derived:
+                self.get(name)
+            return self._versions[name]
+
+    def tickers(self):
+        with self._lock:
+            statements = self._values["statements"]
+            return [] if statements is None else statements.index.tolist()
+
+    def get(self, name):
+        '''Returns an input or a derived value, recomputing it (and whatever it depends
+           on) only if an upstream version moved since the last computation'''
+        with self._lock:
+            if name not in self._derived:
+                return self._values[name]
+
+            dependencies, function = self._derived[name]
+            values = [self.get(dependency) for dependency in dependencies]
+            versions = tuple(self._versions[dependency] for dependency in dependencies)
+            if self._computed_from.get(name) != versions:
+                if any(value is None for value in values):
+                    return None
+                self._values[name] = function(*values)
+                self._versions[name] += 1
+                self._computed_from[name] = versions
+                self.recompute_count[name] = self.recompute_count.get(name, 0) + 1
+            return self._values[name]
+
+    def save(self, path):
+        with self._lock:
+            state = {"perpetual_growth_rate": self.perpetual_growth_rate,
+                     "values": {name: self._values[name] for name in self.INPUTS},
+                     "versions": {name: self._versions[name] for name in self.INPUTS}}
+        with open(path, "wb") as f:
+            pickle.dump(state, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        graph = cls(state["perpetual_growth_rate"])
+        graph._values.update(state["values"])
+        graph._versions.update(state["versions"])
+        return graph
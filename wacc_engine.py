@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import FileCache
+from lazy_imports import lazy_import
+from valuation import compute_wacc, DEFAULT_WACC
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+WACC_INPUT_COLUMNS = ["total_debt", "interest_expense", "pretax_income", "income_taxes",
+                      "beta", "shares_outstanding", "market_cap"]
+
+
+class WaccEngine:
+    '''Computes WACC for a whole ticker list at once.
+
+       The slow-moving per-ticker inputs of calc_wacc (MarketWatch income figures,
+       total debt from the balance sheet, shares outstanding and beta from the
+       quote page) are fetched concurrently and cached on disk for ttl seconds,
+       since they only change with annual reports; failed or empty fetches are
+       not cached. The fetches wait for the scan pipeline's rate limiter
+       (StockInfo.throttle). Market cap and price come from one live batched quote call.
+       The formula then runs once over all tickers, and every ticker that fell
+       back to the default WACC is recorded in self.fallbacks with the reason.
+    '''
+    SOURCES = ("marketwatch", "total_debt", "shares_beta")
+
+    def __init__(self, stock_info, max_workers = 8, ttl = 7*24*3600, cache_dir = None):
+        self.stock_info = stock_info
+        self.max_workers = max_workers
+        self.cache = FileCache("fundamentals", ttl=ttl, cache_dir=cache_dir)
+        self.fallbacks = pd.DataFrame(columns=["reason"])
+
+    def _fetch(self, source, ticker):
+        key = f"{source}_{ticker}"
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        # one page per source, paced with the scan's page fetches
+        self.stock_info.throttle()
+        if source == "marketwatch":
+            value = list(self.stock_info.get_marketwatch_data(ticker))
+            if not any(value):
+                raise AssertionError("no income figures")
+        elif source == "total_debt":
+            value = float(self.stock_info.get_total_debt(ticker))
+        else:
+            shares_outstanding, market_cap, beta = self.stock_info.get_key_statistics(ticker)
+            value = [shares_outstanding, beta]
+        if not isinstance(value, list) or None not in value:
+            self.cache.set(key, value)
+        return value
+
+    def gather_inputs(self, tickers):
+        '''Fetches (or reads from cache) the WACC inputs of all tickers concurrently,
+           and their market cap and price from one live quote call. Returns a
+           ticker-indexed frame of WACC_INPUT_COLUMNS and price plus an "error"
+           column naming the first input that could not be fetched.
+        '''
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {(source, ticker): executor.submit(self._fetch, source, ticker)
+                       for ticker in tickers for source in self.SOURCES}
+
+        quote_error = None
+        try:
+            quotes = self.stock_info.get_live_quotes(tickers)
+        except Exception as e:
+            quotes = pd.DataFrame()
+            quote_error = f"quote: {e}"
+        quotes = quotes.reindex(index=tickers, columns=["marketCap", "regularMarketPrice"])
+
+        rows = []
+        for ticker in tickers:
+            row = dict.fromkeys(WACC_INPUT_COLUMNS)
+            row["error"] = None
+            for source in self.SOURCES:
+                try:
+                    value = futures[(source, ticker)].result()
+                except Exception as e:
+                    row["error"] = row["error"] or f"{source}: {e}"
+                    continue
+                if source == "marketwatch":
+                    row["interest_expense"], row["pretax_income"], row["income_taxes"] = value
+                elif source == "total_debt":
+                    row["total_debt"] = value
+                else:
+                    row["shares_outstanding"], row["beta"] = value
+            row["error"] = row["error"] or quote_error
+            row["market_cap"] = quotes.at[ticker, "marketCap"]
+            row["price"] = quotes.at[ticker, "regularMarketPrice"]
+            rows.append(row)
+
+        inputs = pd.DataFrame(rows, index=pd.Index(tickers, name="ticker"),
+                              columns=WACC_INPUT_COLUMNS + ["price", "error"])
+        numeric = WACC_INPUT_COLUMNS + ["price"]
+        inputs[numeric] = inputs[numeric].apply(pd.to_numeric, errors="coerce")
+        return inputs
+
+    def _fallback_reason(self, row):
+        if pd.notna(row["error"]):
+            return row["error"]
+        for column in ("market_cap", "beta", "pretax_income", "income_taxes"):
+            if pd.isna(row[column]):
+                return f"missing {column}"
+        if row["pretax_income"] == 0:
+            return "zero pretax income"
+        if row["total_debt"] + row["market_cap"] == 0:
+            return "zero debt and market cap"
+        return "degenerate inputs"
+
+    def compute(self, tickers):
+        '''Returns a ticker-indexed series of WACC as a fraction, like calc_wacc'''
+        tickers = list(dict.fromkeys(tickers))
+        inputs = self.gather_inputs(tickers)
+        risk_free_rate = self.stock_info.risk_free_rate
+        wacc = compute_wacc(inputs, inputs["market_cap"], risk_free_rate, default=np.nan)
+
+        defaulted = wacc.index[wacc.isna() | inputs["error"].notna()]
+        self.fallbacks = pd.DataFrame({"reason": [self._fallback_reason(inputs.loc[ticker]) for ticker in defaulted]},
+                                      index=defaulted)
+        for ticker, reason in self.fallbacks["reason"].items():
+            print(f"default WAAC ({DEFAULT_WACC}%) assigned for {ticker}: {reason}")
+        wacc.loc[defaulted] = DEFAULT_WACC / 100
+
+        complete = inputs.drop(defaulted)
+        if not complete.empty:
+            valuation = self.stock_info.valuation
+            valuation.update_input("wacc_inputs", complete[WACC_INPUT_COLUMNS].drop(columns="market_cap"))
+            valuation.update_input("prices", complete[["price"]].dropna())
+        return wacc
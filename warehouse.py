@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from cache import DEFAULT_CACHE_DIR
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+DEFAULT_WAREHOUSE = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), "fundamentals.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS statements (
+    ticker TEXT NOT NULL,
+    statement TEXT NOT NULL,
+    field TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    value REAL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, statement, field, period_end)
+);
+CREATE INDEX IF NOT EXISTS statements_period ON statements (period_end);
+CREATE INDEX IF NOT EXISTS statements_field ON statements (statement, field, period_end);
+"""
+
+_UPSERT = """
+INSERT INTO statements (ticker, statement, field, period_end, value, fetched_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (ticker, statement, field, period_end) DO UPDATE SET
+    value = excluded.value,
+    fetched_at = excluded.fetched_at
+WHERE value IS NOT excluded.value
+"""
+
+
+class Warehouse:
+    '''Local SQLite store of fundamentals in long form: one row per ticker,
+       statement, field and period end.
+
+       Statements are named after the Yahoo tables ("cash_flow",
+       "income_statement", "balance_sheet", with a "quarterly_" prefix for
+       quarterly ones) and keep Yahoo's field names; collect_statements adds
+       "estimates" (analyst revenue estimates) and "valuation" (free cash flow
+       and WACC) rows. Rewriting an unchanged value keeps its fetched_at.
+    '''
+
+    def __init__(self, path = None):
+        self.path = path or DEFAULT_WAREHOUSE
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # written from the WACC engine and scan threads as well; every use of the
+        # shared connection holds the lock, so transactions of threads never interleave
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.executescript(_SCHEMA)
+
+    def _read(self, query, params):
+        with self._lock:
+            return pd.read_sql_query(query, self.connection, params=params)
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+    def write_values(self, rows):
+        '''Upserts (ticker, statement, field, period_end, value) tuples'''
+        fetched_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        with self._lock, self.connection:
+            self.connection.executemany(_UPSERT, [row + (fetched_at,) for row in rows])
+
+    def delete(self, ticker, statement):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM statements WHERE ticker = ? AND statement = ?", (ticker, statement))
+
+    def write_statement(self, ticker, statement, data_frame):
+        '''Stores a statement frame with one row per period (indexed by period end
+           date) and one column per field, like collect_statements' inputs;
+           non-numeric fields are skipped
+
+           @param: ticker
+           @param: statement - e.g. "cash_flow"
+           @param: data_frame
+        '''
+        values = data_frame.apply(pd.to_numeric, errors="coerce")
+        values.index = pd.to_datetime(values.index).strftime("%Y-%m-%d")
+        values = values.stack().dropna()
+        self.write_values([(ticker, statement, str(field), period_end, float(value))
+                           for (period_end, field), value in values.items()])
+
+    def write_table(self, ticker, statement, table):
+        '''Stores a _parse_table result (fields as rows, period ends as columns)'''
+        self.write_statement(ticker, statement, table.transpose())
+
+    def get(self, ticker, statement = None):
+        '''Point lookup: all stored rows of a ticker, optionally of one statement'''
+        query = "SELECT statement, field, period_end, value, fetched_at FROM statements WHERE ticker = ?"
+        params = [ticker]
+        if statement is not None:
+            query += " AND statement = ?"
+            params.append(statement)
+        return self._read(query + " ORDER BY statement, field, period_end", params)
+
+    def history(self, statement, field, tickers = None):
+        '''Long frame (ticker, period_end, value) of one field for many tickers'''
+        query = "SELECT ticker, period_end, value FROM statements WHERE statement = ? AND field = ?"
+        params = [statement, field]
+        if tickers is not None:
+            query += " AND ticker IN ({})".format(",".join("?" * len(tickers)))
+            params += list(tickers)
+        return self._read(query + " ORDER BY ticker, period_end", params)
+
+    def cross_section(self, statement, field, period_end = None):
+        '''Ticker-indexed series of a field: the given period end, or the latest
+           period of every ticker'''
+        if period_end is not None:
+            frame = self._read("""SELECT ticker, value FROM statements
+                                  WHERE statement = ? AND field = ? AND period_end = ?""",
+                               [statement, field, period_end])
+        else:
+            frame = self._read("""SELECT ticker, value, max(period_end) FROM statements
+                                  WHERE statement = ? AND field = ? GROUP BY ticker""",
+                               [statement, field])
+        return frame.set_index("ticker")["value"]
+
+    def wide(self, statement, field, years = None, tickers = None):
+        '''Legacy wide layout: a Ticker column and one column per year, the last
+           `years` years only if given'''
+        history = self.history(statement, field, tickers)
+        history["year"] = history["period_end"].str[:4]
+        table = history.pivot_table(index="ticker", columns="year", values="value", aggfunc="last")
+        if years is not None:
+            table = table[sorted(table.columns)[-years:]]
+        table.columns = [str(column) for column in table.columns]
+        return table.rename_axis("Ticker").reset_index()
+
+    def export_legacy_csvs(self, directory, prefix = ""):
+        '''Writes the cash_flow, revenue, net_income and required_growth CSVs of
+           get_cash_flow_for_all for every ticker that passed collect_statements'''
+        cash_flow = self.wide("valuation", "free_cash_flow", years=4)
+        tickers = cash_flow["Ticker"].tolist()
+
+        revenue = self.wide("income_statement", "totalRevenue", years=4, tickers=tickers)
+        estimates = self.wide("estimates", "revenueEstimate", years=2, tickers=tickers)
+        revenue = revenue.merge(estimates, on="Ticker", how="left", suffixes=("", "_estimate"))
+        net_income = self.wide("cash_flow", "netIncome", years=4, tickers=tickers)
+        wacc = self.cross_section("valuation", "wacc").reindex(tickers)
+        required_growth = pd.DataFrame({"Ticker": tickers, "Growth": wacc.values})
+
+        for name, frame in (("cash_flow", cash_flow), ("revenue", revenue),
+                            ("net_income", net_income), ("required_growth", required_growth)):
+            fname = os.path.join(directory, prefix + name + ".csv")
+            print(f"saving into {fname}")
+            frame.to_csv(fname)